@@ -5,6 +5,17 @@ from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from config import config
 from models import db
+from services import cache as response_cache
+from services.view_counter import view_counter
+from services.category_registry import category_registry
+from services.suggest import suggester
+from services.expiry import expiry_sweeper
+from services.geo import vendor_locator
+from services import cart_store
+from services.reservations import reservations
+from services.tasks import task_queue
+from services.idempotency import idempotency_store
+from services import order_events  # registers job handlers
 from routes.auth import auth_bp
 from routes.products import products_bp
 from routes.cart import cart_bp
@@ -24,6 +35,16 @@ def create_app(config_name='production'):
     db.init_app(app)
     migrate = Migrate(app, db)
     jwt = JWTManager(app)
+    response_cache.init_app(app)
+    view_counter.init_app(app)
+    category_registry.init_app(app)
+    suggester.init_app(app)
+    expiry_sweeper.init_app(app)
+    vendor_locator.init_app(app)
+    cart_store.init_app(app)
+    reservations.init_app(app)
+    task_queue.init_app(app)
+    idempotency_store.init_app(app)
     
     # ✅ Universal CORS configuration (covers all Vercel subdomains + localhost)
     CORS(app, resources={
@@ -53,6 +74,11 @@ def create_app(config_name='production'):
     def health_check():
         return {'status': 'healthy', 'message': 'Surplus E-commerce API is running'}, 200
     
+    @app.route('/api/metrics')
+    def metrics():
+        # Counters are per worker process
+        return {'pid': os.getpid(), 'caches': response_cache.cache_stats(), 'tasks': task_queue.stats()}, 200
+    
     @app.route('/')
     def root():
         return {'message': 'Surplus E-commerce API', 'health': '/api/health'}, 200
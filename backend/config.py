@@ -11,6 +11,67 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    
+    # Start the periodic background threads below; turn off for CLI runs such as `flask db upgrade`
+    BACKGROUND_TASKS_ENABLED = os.environ.get('BACKGROUND_TASKS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    
+    # Response caches: 'memory' (one LRU per worker) or 'sqlite' (shared by workers on a host).
+    # The cart summary cache always uses the SQLite file.
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH') or os.path.join(os.path.dirname(__file__), 'instance', 'cache.db')
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 30))  # seconds
+    RESPONSE_CACHE_MAXSIZE = 256
+    RESPONSE_CACHE_PURGE_INTERVAL = 600  # seconds between deletes of expired rows in the SQLite file
+    
+    # Product views are buffered per worker and flushed in batches
+    VIEW_COUNT_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL', 10))  # seconds
+    VIEW_COUNT_FLUSH_THRESHOLD = 500  # pending views that trigger an early flush
+    
+    # How often each worker checks whether categories / vendor pincodes changed elsewhere
+    CATEGORY_REGISTRY_CHECK_INTERVAL = 5  # seconds
+    VENDOR_LOCATOR_CHECK_INTERVAL = 5  # seconds
+    
+    # Autocomplete index is rebuilt from the database this often per worker
+    SUGGEST_REBUILD_INTERVAL = int(os.environ.get('SUGGEST_REBUILD_INTERVAL', 300))  # seconds
+    
+    # Expired stock is deactivated and expiry buckets re-computed in the background
+    EXPIRY_SWEEP_INTERVAL = int(os.environ.get('EXPIRY_SWEEP_INTERVAL', 300))  # seconds
+    EXPIRY_SWEEP_BATCH_SIZE = 500  # rows per UPDATE transaction
+    
+    # Pincode -> lat/lon table and vendor grid for near_pincode filtering
+    PINCODE_DATA_PATH = os.environ.get('PINCODE_DATA_PATH') or os.path.join(os.path.dirname(__file__), 'data', 'pincodes.csv')
+    GEO_GRID_CELL_KM = 10
+    NEAR_PINCODE_DEFAULT_RADIUS_KM = 10
+    NEAR_PINCODE_MAX_RADIUS_KM = 100
+    
+    # Rows fetched and written per chunk by /api/products/feed
+    FEED_BATCH_SIZE = 500
+    # Seconds /feed?since= looks back to catch writes that committed after their updated_at
+    FEED_SINCE_OVERLAP = 300
+    
+    # Anonymous carts: 'sqlite' (a local file shared by the workers on a host) or 'memory' (single worker)
+    GUEST_CART_BACKEND = os.environ.get('GUEST_CART_BACKEND', 'sqlite')
+    GUEST_CART_PATH = os.environ.get('GUEST_CART_PATH') or os.path.join(os.path.dirname(__file__), 'instance', 'guest_carts.db')
+    GUEST_CART_TTL = 7 * 24 * 3600  # seconds since the last change
+    GUEST_CART_PURGE_INTERVAL = 3600  # seconds between deletes of expired guest carts
+    
+    # Hold stock for signed-in carts while they check out (see services/reservations.py)
+    STOCK_RESERVATIONS_ENABLED = os.environ.get('STOCK_RESERVATIONS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 15 * 60))  # seconds since the cart line changed
+    STOCK_RESERVATION_REAP_INTERVAL = 60
+    STOCK_RESERVATION_REAP_BATCH_SIZE = 500
+    
+    # Outbox job queue for post-checkout side effects (see services/tasks.py)
+    TASK_QUEUE_WORKERS = int(os.environ.get('TASK_QUEUE_WORKERS', 2))
+    TASK_QUEUE_POLL_INTERVAL = 2  # seconds
+    TASK_QUEUE_MAX_ATTEMPTS = 5
+    TASK_QUEUE_RETRY_DELAY = 10  # seconds before the first retry; doubles each time
+    TASK_QUEUE_STALE_AFTER = 300  # seconds before a job left running is claimed again
+    
+    # Idempotency-Key replays for order creation, cancellation and add-to-cart
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))  # seconds a stored response is replayed
+    IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds before an unfinished request's key can be claimed again
+    IDEMPOTENCY_PURGE_INTERVAL = 3600
 
 
 class DevelopmentConfig(Config):
@@ -36,7 +97,7 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///surplus_test.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///surplus_test.db'
 
 
 config = {
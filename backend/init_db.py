@@ -1,6 +1,10 @@
 """Initialize database with sample data"""
+import os
+os.environ.setdefault('BACKGROUND_TASKS_ENABLED', 'false')  # a one-off script, not a server
+
 from app import create_app
 from models import db, Category
+from services import search as product_search
 from datetime import datetime
 
 def init_database():
@@ -11,6 +15,10 @@ def init_database():
         db.create_all()
         print("Database tables created successfully!")
         
+        # Make sure the search index covers existing products
+        product_search.rebuild_index()
+        db.session.commit()
+        
         # Check if categories exist
         if Category.query.count() == 0:
             # Add sample categories
@@ -0,0 +1,40 @@
+"""Product full-text search index
+
+Revision ID: 3f2a9c1d7e41
+Revises: 59bcc865b929
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e41'
+down_revision = '59bcc865b929'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_DOCUMENT = ("to_tsvector('english', coalesce(name, '') || ' ' || "
+                   "coalesce(brand, '') || ' ' || coalesce(description, ''))")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.create_index('ix_products_search', 'products', [sa.text(SEARCH_DOCUMENT)],
+                        unique=False, postgresql_using='gin')
+    elif bind.dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS products_fts "
+                   "USING fts5(name, brand, description, tokenize='porter unicode61')")
+        op.execute("INSERT INTO products_fts (rowid, name, brand, description) "
+                   "SELECT id, name, brand, description FROM products")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_products_search', table_name='products')
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS products_fts")
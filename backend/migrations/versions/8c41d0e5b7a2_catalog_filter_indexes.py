@@ -0,0 +1,66 @@
+"""Composite indexes for catalog filters and foreign keys
+
+Revision ID: 8c41d0e5b7a2
+Revises: 3f2a9c1d7e41
+Create Date: 2026-10-18 11:02:47.518309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41d0e5b7a2'
+down_revision = '3f2a9c1d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_active_created', ['is_active', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_products_active_category_created', ['is_active', 'category_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_products_active_price', ['is_active', 'discounted_price', 'id'], unique=False)
+        batch_op.create_index('ix_products_active_expiry', ['is_active', 'expiry_date', 'id'], unique=False)
+        batch_op.create_index('ix_products_active_popular', ['is_active', 'sold_count', 'id'], unique=False)
+        batch_op.create_index('ix_products_vendor_created', ['vendor_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.create_index('ix_cart_items_user_id', ['user_id'], unique=False)
+        batch_op.create_index('ix_cart_items_product_id', ['product_id'], unique=False)
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index('ix_orders_user_created', ['user_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('order_items', schema=None) as batch_op:
+        batch_op.create_index('ix_order_items_order_id', ['order_id'], unique=False)
+        batch_op.create_index('ix_order_items_product_order', ['product_id', 'order_id'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_product_created', ['product_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_reviews_user_id', ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_user_id')
+        batch_op.drop_index('ix_reviews_product_created')
+
+    with op.batch_alter_table('order_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_items_product_order')
+        batch_op.drop_index('ix_order_items_order_id')
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index('ix_orders_user_created')
+
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_cart_items_product_id')
+        batch_op.drop_index('ix_cart_items_user_id')
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_vendor_created')
+        batch_op.drop_index('ix_products_active_popular')
+        batch_op.drop_index('ix_products_active_expiry')
+        batch_op.drop_index('ix_products_active_price')
+        batch_op.drop_index('ix_products_active_category_created')
+        batch_op.drop_index('ix_products_active_created')
@@ -0,0 +1,39 @@
+"""One cart line per user and product
+
+Revision ID: a4d62c8e1f90
+Revises: f3b90d6c2e57
+Create Date: 2026-10-18 14:41:55.306127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d62c8e1f90'
+down_revision = 'f3b90d6c2e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fold duplicate lines into the oldest one before the unique index goes on
+    op.execute("""
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(duplicate.quantity) FROM cart_items AS duplicate
+            WHERE duplicate.user_id = cart_items.user_id AND duplicate.product_id = cart_items.product_id
+        )
+        WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1)
+    """)
+    op.execute("DELETE FROM cart_items WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id)")
+
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.create_index('uq_cart_items_user_product', ['user_id', 'product_id'], unique=True)
+        # The unique index leads with user_id, so it also serves per-user lookups
+        batch_op.drop_index('ix_cart_items_user_id')
+
+
+def downgrade():
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.create_index('ix_cart_items_user_id', ['user_id'], unique=False)
+        batch_op.drop_index('uq_cart_items_user_product')
@@ -0,0 +1,35 @@
+"""Time-decayed trending score on products
+
+Revision ID: b7e3f19a4c05
+Revises: 8c41d0e5b7a2
+Create Date: 2026-10-18 11:48:09.733514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f19a4c05'
+down_revision = '8c41d0e5b7a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('trending_score', sa.Float(), nullable=True, server_default='0'))
+
+    # Seed from lifetime counters as if every past event happened at the scoring epoch,
+    # so new sales and views quickly outrank old ones
+    op.execute("UPDATE products SET trending_score = "
+               "COALESCE(sold_count, 0) + 0.05 * COALESCE(views_count, 0)")
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_active_trending', ['is_active', 'trending_score', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_active_trending')
+        batch_op.drop_column('trending_score')
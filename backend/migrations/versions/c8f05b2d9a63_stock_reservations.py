@@ -0,0 +1,46 @@
+"""Stock reservations held by carts
+
+Revision ID: c8f05b2d9a63
+Revises: a4d62c8e1f90
+Create Date: 2026-10-18 16:02:37.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f05b2d9a63'
+down_revision = 'a4d62c8e1f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reserved_quantity', sa.Integer(), nullable=False, server_default='0'))
+
+    op.create_table('stock_reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_reservations', schema=None) as batch_op:
+        batch_op.create_index('uq_stock_reservations_user_product', ['user_id', 'product_id'], unique=True)
+        batch_op.create_index('ix_stock_reservations_expires', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_reservations', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_reservations_expires')
+        batch_op.drop_index('uq_stock_reservations_user_product')
+
+    op.drop_table('stock_reservations')
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('reserved_quantity')
@@ -0,0 +1,28 @@
+"""Registry version counters
+
+Revision ID: d2a85e6f0b13
+Revises: b7e3f19a4c05
+Create Date: 2026-10-18 12:36:52.240918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a85e6f0b13'
+down_revision = 'b7e3f19a4c05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('registry_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('registry_versions')
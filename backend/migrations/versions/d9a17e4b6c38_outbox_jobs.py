@@ -0,0 +1,40 @@
+"""Outbox table for background jobs
+
+Revision ID: d9a17e4b6c38
+Revises: c8f05b2d9a63
+Create Date: 2026-10-18 17:20:11.845093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a17e4b6c38'
+down_revision = 'c8f05b2d9a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('outbox_jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_outbox_jobs_status_run_after', ['status', 'run_after'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outbox_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_outbox_jobs_status_run_after')
+
+    op.drop_table('outbox_jobs')
@@ -0,0 +1,44 @@
+"""Idempotency keys for unsafe POSTs
+
+Revision ID: e1b38c7f5d24
+Revises: d9a17e4b6c38
+Create Date: 2026-10-18 18:05:42.190377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b38c7f5d24'
+down_revision = 'd9a17e4b6c38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_keys',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner', sa.String(length=100), nullable=False),
+    sa.Column('scope', sa.String(length=200), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('fingerprint', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('response_status', sa.Integer(), nullable=True),
+    sa.Column('response_body', sa.Text(), nullable=True),
+    sa.Column('response_headers', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.create_index('uq_idempotency_keys_owner_scope_key', ['owner', 'scope', 'key'], unique=True)
+        batch_op.create_index('ix_idempotency_keys_expires', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.drop_index('ix_idempotency_keys_expires')
+        batch_op.drop_index('uq_idempotency_keys_owner_scope_key')
+
+    op.drop_table('idempotency_keys')
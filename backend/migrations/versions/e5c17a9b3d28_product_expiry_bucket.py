@@ -0,0 +1,43 @@
+"""Expiry bucket on products
+
+Revision ID: e5c17a9b3d28
+Revises: d2a85e6f0b13
+Create Date: 2026-10-18 13:21:40.118305
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c17a9b3d28'
+down_revision = 'd2a85e6f0b13'
+branch_labels = None
+depends_on = None
+
+# Mirrors services/expiry.py EXPIRY_BUCKETS at the time of this migration: (min days, max days)
+BUCKETS = [(0, 0), (1, 3), (4, 7), (8, 14), (15, 30), (31, None)]
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('expiry_bucket', sa.SmallInteger(), nullable=True))
+
+    products = sa.table('products', sa.column('expiry_date', sa.Date), sa.column('expiry_bucket', sa.SmallInteger))
+    today = datetime.utcnow().date()
+    op.execute(products.update().where(products.c.expiry_date < today).values(expiry_bucket=-1))
+    for bucket, (min_days, max_days) in enumerate(BUCKETS):
+        condition = products.c.expiry_date >= today + timedelta(days=min_days)
+        if max_days is not None:
+            condition = sa.and_(condition, products.c.expiry_date <= today + timedelta(days=max_days))
+        op.execute(products.update().where(condition).values(expiry_bucket=bucket))
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_active_bucket_discount', ['is_active', 'expiry_bucket', 'discount_percentage'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_active_bucket_discount')
+        batch_op.drop_column('expiry_bucket')
@@ -0,0 +1,26 @@
+"""Index products by updated_at for incremental feeds
+
+Revision ID: f3b90d6c2e57
+Revises: e5c17a9b3d28
+Create Date: 2026-10-18 14:02:17.502911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b90d6c2e57'
+down_revision = 'e5c17a9b3d28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_updated', ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_updated')
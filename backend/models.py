@@ -1,5 +1,8 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, query_expression, validates
 import bcrypt
 
 db = SQLAlchemy()
@@ -102,6 +105,17 @@ class Category(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_active_created', 'is_active', 'created_at', 'id'),
+        db.Index('ix_products_active_category_created', 'is_active', 'category_id', 'created_at'),
+        db.Index('ix_products_active_price', 'is_active', 'discounted_price', 'id'),
+        db.Index('ix_products_active_expiry', 'is_active', 'expiry_date', 'id'),
+        db.Index('ix_products_active_popular', 'is_active', 'sold_count', 'id'),
+        db.Index('ix_products_vendor_created', 'vendor_id', 'created_at', 'id'),
+        db.Index('ix_products_updated', 'updated_at', 'id'),
+        db.Index('ix_products_active_trending', 'is_active', 'trending_score', 'id'),
+        db.Index('ix_products_active_bucket_discount', 'is_active', 'expiry_bucket', 'discount_percentage'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     vendor_id = db.Column(db.Integer, db.ForeignKey('vendor_profiles.id'), nullable=False)
@@ -112,7 +126,9 @@ class Product(db.Model):
     discounted_price = db.Column(db.Float, nullable=False)
     discount_percentage = db.Column(db.Float)
     stock_quantity = db.Column(db.Integer, nullable=False, default=0)
+    reserved_quantity = db.Column(db.Integer, nullable=False, default=0)  # held by carts, see services/reservations.py
     expiry_date = db.Column(db.Date, nullable=False)
+    expiry_bucket = db.Column(db.SmallInteger)  # see services/expiry.py; kept current by the sweeper
     manufacturing_date = db.Column(db.Date)
     brand = db.Column(db.String(100))
     unit = db.Column(db.String(50))  # kg, liters, pieces, etc.
@@ -121,28 +137,52 @@ class Product(db.Model):
     additional_images = db.Column(db.Text)  # JSON string of image URLs
     views_count = db.Column(db.Integer, default=0)
     sold_count = db.Column(db.Integer, default=0)
+    trending_score = db.Column(db.Float, default=0)  # see services/trending.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     cart_items = db.relationship('CartItem', backref='product', lazy=True, cascade='all, delete-orphan')
+    reservations = db.relationship('StockReservation', lazy=True, cascade='all, delete-orphan')
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     reviews = db.relationship('Review', backref='product', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        days_to_expiry = (self.expiry_date - datetime.utcnow().date()).days if self.expiry_date else None
+    def get_category_name(self):
+        # Categories are cached process-wide, so listings don't load them per product
+        from services.category_registry import category_registry
+        category = category_registry.get(self.category_id)
+        if category is not None:
+            return category['name']
+        return self.category.name if self.category else None
+    
+    @property
+    def available_quantity(self):
+        """Stock not held by anyone's cart reservation"""
+        return max((self.stock_quantity or 0) - (self.reserved_quantity or 0), 0)
+    
+    @validates('expiry_date')
+    def _set_expiry_bucket(self, key, expiry_date):
+        from services.expiry import expiry_bucket
+        self.expiry_bucket = expiry_bucket(expiry_date)
+        return expiry_date
+    
+    def to_dict(self, today=None):
+        # Listings pass ``today`` once instead of reading the clock per row
+        today = today or datetime.utcnow().date()
+        days_to_expiry = (self.expiry_date - today).days if self.expiry_date else None
         return {
             'id': self.id,
             'vendor_id': self.vendor_id,
             'vendor_name': self.vendor.business_name if self.vendor else None,
             'category_id': self.category_id,
-            'category_name': self.category.name if self.category else None,
+            'category_name': self.get_category_name(),
             'name': self.name,
             'description': self.description,
             'original_price': self.original_price,
             'discounted_price': self.discounted_price,
             'discount_percentage': self.discount_percentage,
             'stock_quantity': self.stock_quantity,
+            'available_quantity': self.available_quantity,
             'expiry_date': self.expiry_date.isoformat() if self.expiry_date else None,
             'days_to_expiry': days_to_expiry,
             'manufacturing_date': self.manufacturing_date.isoformat() if self.manufacturing_date else None,
@@ -156,6 +196,42 @@ class Product(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+def product_load_options(path=None):
+    """Loader options that fetch a product's vendor in the same query.
+    
+    Category names come from the process-wide category registry instead.
+    
+    Pass ``path`` (e.g. ``CartItem.product``) to load products through a relationship.
+    """
+    if path is None:
+        return (joinedload(Product.vendor),)
+    return (joinedload(path).joinedload(Product.vendor),)
+
+def upsert_insert():
+    """The current dialect's ``insert``, which supports ``on_conflict_do_update``"""
+    dialect = db.session.get_bind().dialect.name
+    return postgresql_insert if dialect == 'postgresql' else sqlite_insert
+
+class RegistryVersion(db.Model):
+    """Version counters that let every worker notice changes to cached registries"""
+    __tablename__ = 'registry_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def current(cls, name):
+        row = db.session.get(cls, name)
+        return row.version if row else 0
+    
+    @classmethod
+    def bump(cls, name):
+        """Increment the version in the caller's transaction, creating the row on first use"""
+        statement = upsert_insert()(cls.__table__).values(name=name, version=1)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['name'], set_={'version': cls.__table__.c.version + 1}
+        ))
+
 class Address(db.Model):
     __tablename__ = 'addresses'
     
@@ -186,6 +262,10 @@ class Address(db.Model):
 
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.Index('uq_cart_items_user_product', 'user_id', 'product_id', unique=True),
+        db.Index('ix_cart_items_product_id', 'product_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -194,16 +274,72 @@ class CartItem(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    def to_dict(self, today=None, subtotal=None):
+        if subtotal is None:
+            subtotal = self.product.discounted_price * self.quantity if self.product else 0
         return {
             'id': self.id,
-            'product': self.product.to_dict() if self.product else None,
+            'product': self.product.to_dict(today) if self.product else None,
             'quantity': self.quantity,
-            'subtotal': self.product.discounted_price * self.quantity if self.product else 0
+            'subtotal': subtotal
         }
 
+class StockReservation(db.Model):
+    """Stock held for a user's cart line until ``expires_at``; counted in Product.reserved_quantity"""
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.Index('uq_stock_reservations_user_product', 'user_id', 'product_id', unique=True),
+        db.Index('ix_stock_reservations_expires', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class OutboxJob(db.Model):
+    """A background job recorded in the transaction that caused it (see services/tasks.py)"""
+    __tablename__ = 'outbox_jobs'
+    __table_args__ = (
+        db.Index('ix_outbox_jobs_status_run_after', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(db.Model):
+    """A client's Idempotency-Key and the response it got (see services/idempotency.py)"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('uq_idempotency_keys_owner_scope_key', 'owner', 'scope', 'key', unique=True),
+        db.Index('ix_idempotency_keys_expires', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)  # user:<id>, guest:<cart id> or anonymous
+    scope = db.Column(db.String(200), nullable=False)  # method and path
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, complete
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_headers = db.Column(db.Text)  # JSON list of [name, value]
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_created', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -234,6 +370,25 @@ class Order(db.Model):
     # Relationships
     order_items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     
+    # Filled in by order history queries in summary mode (see routes/orders.py)
+    item_count = query_expression()
+    first_item_image = query_expression()
+    
+    def to_summary_dict(self):
+        """Header fields for order history lists, without line items"""
+        return {
+            'id': self.id,
+            'order_number': self.order_number,
+            'status': self.status,
+            'final_amount': self.final_amount,
+            'payment_method': self.payment_method,
+            'payment_status': self.payment_status,
+            'item_count': self.item_count,
+            'thumbnail': self.first_item_image,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -262,6 +417,10 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('ix_order_items_order_id', 'order_id'),
+        db.Index('ix_order_items_product_order', 'product_id', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
@@ -285,6 +444,10 @@ class OrderItem(db.Model):
 
 class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        db.Index('ix_reviews_product_created', 'product_id', 'created_at'),
+        db.Index('ix_reviews_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
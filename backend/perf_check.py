@@ -0,0 +1,292 @@
+"""Performance checks against a seeded throwaway database.
+
+    python perf_check.py budget     # fail if an endpoint exceeds its SQL query budget
+    python perf_check.py explain    # print the query plan of every statement an endpoint runs
+    python perf_check.py checkout   # fire concurrent checkouts at one SKU and fail on any oversell
+
+Uses TEST_DATABASE_URL (an in-memory SQLite database by default; checkout needs
+a database shared between threads and falls back to a temporary SQLite file).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite://')
+# The shared cache and guest cart files must not outlive the throwaway database
+_scratch = tempfile.mkdtemp()
+os.environ.setdefault('RESPONSE_CACHE_PATH', os.path.join(_scratch, 'cache.db'))
+os.environ.setdefault('GUEST_CART_PATH', os.path.join(_scratch, 'guest_carts.db'))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app
+from config import config
+from models import db, User, VendorProfile, Category, Product, CartItem, Order, OrderItem, Review
+from services import search as product_search
+from services.category_registry import category_registry
+from services.suggest import suggester
+from services.geo import vendor_locator
+
+# (path, role, maximum SQL statements per request)
+QUERY_BUDGETS = [
+    ('/api/products', None, 2),
+    ('/api/products?search=milk', None, 2),
+    ('/api/products?cursor=', None, 1),
+    ('/api/products?facets=1', None, 3),
+    ('/api/products?near_pincode=560034&radius_km=10', None, 2),
+    ('/api/products/featured', None, 1),
+    ('/api/products/trending', None, 1),
+    ('/api/products/suggest?q=mil', None, 0),
+    ('/api/products/batch?ids=1,2,3,4,5,6,7,8,9,10', None, 1),
+    ('/api/vendor/products', 'vendor', 4),
+    ('/api/cart', 'customer', 1),
+    ('/api/cart/summary', 'customer', 1),
+    ('/api/orders', 'customer', 3),
+    ('/api/orders?view=summary', 'customer', 2),
+    ('/api/orders?view=summary&cursor=', 'customer', 1),
+    ('/api/categories', None, 1),
+]
+
+# (path, role) for every query shape the catalog indexes are meant to serve
+EXPLAIN_ENDPOINTS = [
+    ('/api/products', None),
+    ('/api/products?cursor=', None),
+    ('/api/products?category_id=1', None),
+    ('/api/products?min_price=100&max_price=300&sort_by=price_low', None),
+    ('/api/products?sort_by=price_high', None),
+    ('/api/products?days_to_expiry=7&sort_by=expiry', None),
+    ('/api/products?sort_by=popular', None),
+    ('/api/products?search=milk', None),
+    ('/api/products?facets=1&category_id=1', None),
+    ('/api/products/featured', None),
+    ('/api/products/trending', None),
+    ('/api/vendor/products', 'vendor'),
+    ('/api/vendor/orders', 'vendor'),
+    ('/api/cart', 'customer'),
+    ('/api/cart/summary', 'customer'),
+    ('/api/orders', 'customer'),
+    ('/api/orders?view=summary', 'customer'),
+    ('/api/reviews/product/1', None),
+]
+
+PRODUCT_NAMES = ['Milk', 'Bread', 'Butter', 'Cheese', 'Yogurt', 'Juice', 'Biscuits', 'Chips', 'Soap', 'Detergent']
+
+
+def seed_database(vendors=3, products_per_vendor=50, cart_size=10, orders=20):
+    """Create tables and fill them with a small catalog. Returns auth tokens by role."""
+    db.create_all()
+
+    categories = [Category(name=name, slug=name.lower()) for name in ('Dairy', 'Bakery', 'Snacks', 'Household')]
+    db.session.add_all(categories)
+
+    vendor_users = []
+    for i in range(vendors):
+        user = User(email=f'vendor{i}@example.com', first_name='Vendor', last_name=str(i), role='vendor', password_hash='x')
+        user.vendor_profile = VendorProfile(business_name=f'Vendor Store {i}', city='Bengaluru', pincode='560001')
+        vendor_users.append(user)
+    customer = User(email='customer@example.com', first_name='Customer', last_name='One', role='customer', password_hash='x')
+    db.session.add_all(vendor_users + [customer])
+    db.session.flush()
+
+    products = []
+    today = date.today()
+    for v, user in enumerate(vendor_users):
+        for i in range(products_per_vendor):
+            original = 50 + (i * 37) % 950
+            products.append(Product(
+                vendor_id=user.vendor_profile.id,
+                category_id=categories[i % len(categories)].id,
+                name=f'{PRODUCT_NAMES[i % len(PRODUCT_NAMES)]} {v}-{i}',
+                description='Surplus stock close to expiry',
+                brand=f'Brand {i % 7}',
+                original_price=original,
+                discounted_price=round(original * 0.6, 2),
+                discount_percentage=40,
+                stock_quantity=1 + i % 20,
+                expiry_date=today + timedelta(days=i % 30),
+                sold_count=(i * 13) % 50,
+                views_count=(i * 29) % 500
+            ))
+    db.session.add_all(products)
+    db.session.flush()
+
+    for product in products[:cart_size]:
+        db.session.add(CartItem(user_id=customer.id, product_id=product.id, quantity=1))
+
+    for i in range(orders):
+        product = products[(i * 7) % len(products)]
+        order = Order(
+            user_id=customer.id, order_number=f'ORDPERF{i:05d}', status='confirmed',
+            total_amount=product.discounted_price, final_amount=product.discounted_price,
+            payment_method='cod', shipping_name='Customer One', shipping_phone='9999999999',
+            shipping_address_line1='1 Main Road', shipping_city='Bengaluru',
+            shipping_state='Karnataka', shipping_pincode='560001'
+        )
+        order.order_items.append(OrderItem(
+            product_id=product.id, product_name=product.name, quantity=1,
+            unit_price=product.discounted_price, total_price=product.discounted_price
+        ))
+        db.session.add(order)
+        db.session.add(Review(user_id=customer.id, product_id=products[i % 5].id, rating=1 + i % 5, comment='Good value'))
+
+    product_search.rebuild_index()
+    db.session.commit()
+    category_registry.refresh()
+    suggester.rebuild()
+    vendor_locator.refresh()
+
+    return {
+        'vendor': create_access_token(identity=str(vendor_users[0].id)),
+        'customer': create_access_token(identity=str(customer.id))
+    }
+
+
+@contextmanager
+def capture_queries():
+    """Collect ``(statement, parameters)`` for every SQL statement this thread issues inside the block.
+
+    Background tasks (view counter, outbox dispatcher, ...) run on their own threads and are not counted.
+    """
+    statements = []
+    thread = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def request_endpoint(client, path, token=None):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    with capture_queries() as statements:
+        response = client.get(path, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} returned {response.status_code}: {response.get_data(as_text=True)}')
+    return statements
+
+
+def check_budgets(app, tokens):
+    client = app.test_client()
+    failures = 0
+    for path, role, budget in QUERY_BUDGETS:
+        count = len(request_endpoint(client, path, tokens.get(role)))
+        status = 'ok' if count <= budget else 'OVER BUDGET'
+        if count > budget:
+            failures += 1
+        print(f'{path:<40} {count:>3} / {budget:<3} {status}')
+    return failures
+
+
+def explain_endpoints(app, tokens):
+    client = app.test_client()
+    connection = db.session.connection()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    for path, role in EXPLAIN_ENDPOINTS:
+        print(f'== {path}')
+        for statement, parameters in request_endpoint(client, path, tokens.get(role)):
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            print(' '.join(statement.split()))
+            for row in connection.exec_driver_sql(prefix + statement, parameters):
+                print('    ' + ' | '.join(str(value) for value in row))
+        print()
+
+
+def check_checkout(app, buyers=200, stock=50):
+    """Have ``buyers`` customers check out the same SKU at once; only ``stock`` may succeed."""
+    vendor = VendorProfile.query.first()
+    product = Product(
+        vendor_id=vendor.id, category_id=Category.query.first().id, name='Contended SKU',
+        original_price=100, discounted_price=60, discount_percentage=40,
+        stock_quantity=stock, expiry_date=date.today() + timedelta(days=5)
+    )
+    customers = [
+        User(email=f'buyer{i}@example.com', first_name='Buyer', last_name=str(i), role='customer', password_hash='x')
+        for i in range(buyers)
+    ]
+    db.session.add(product)
+    db.session.add_all(customers)
+    db.session.flush()
+    db.session.add_all([CartItem(user_id=customer.id, product_id=product.id, quantity=1) for customer in customers])
+    db.session.commit()
+    product_id = product.id
+    tokens = [create_access_token(identity=str(customer.id)) for customer in customers]
+    db.session.remove()
+
+    body = {'shipping_name': 'Buyer', 'shipping_phone': '9999999999', 'shipping_address_line1': '1 Main Road',
+            'shipping_city': 'Bengaluru', 'shipping_state': 'Karnataka', 'shipping_pincode': '560001',
+            'payment_method': 'cod'}
+    start = threading.Barrier(buyers)
+    statuses = [None] * buyers
+
+    def checkout(i):
+        client = app.test_client()
+        start.wait()
+        statuses[i] = client.post('/api/orders', json=body, headers={'Authorization': f'Bearer {tokens[i]}'}).status_code
+
+    threads = [threading.Thread(target=checkout, args=(i,)) for i in range(buyers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    remaining = db.session.get(Product, product_id).stock_quantity
+    sold = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)).filter(
+        OrderItem.product_id == product_id
+    ).scalar()
+    placed = statuses.count(201)
+    counts = {status: statuses.count(status) for status in sorted(set(statuses))}
+    print(f'{buyers} checkouts of a SKU with stock {stock}: {counts}')
+    print(f'orders placed {placed}, units sold {sold}, stock left {remaining}')
+
+    failures = 0
+    if remaining < 0 or sold > stock:
+        print('OVERSOLD')
+        failures += 1
+    if remaining != stock - sold or placed != sold:
+        print('Stock, order items and responses disagree')
+        failures += 1
+    if placed != min(stock, buyers):
+        print(f'Expected {min(stock, buyers)} orders to succeed')
+        failures += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('check', choices=['budget', 'explain', 'checkout'])
+    args = parser.parse_args()
+
+    if args.check == 'checkout' and config['testing'].SQLALCHEMY_DATABASE_URI in ('sqlite://', 'sqlite:///:memory:'):
+        # Every thread gets its own in-memory database; share a file instead
+        path = os.path.join(tempfile.mkdtemp(), 'checkout.db')
+        config['testing'].SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+
+    app = create_app('testing')
+    with app.app_context():
+        tokens = seed_database()
+        if args.check == 'budget':
+            failures = check_budgets(app, tokens)
+            if failures:
+                print(f'\n{failures} endpoint(s) exceeded their query budget')
+                return 1
+        elif args.check == 'explain':
+            explain_endpoints(app, tokens)
+        elif args.check == 'checkout':
+            failures = check_checkout(app)
+            if failures:
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
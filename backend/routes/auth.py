@@ -1,10 +1,27 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from models import db, User, VendorProfile
+from services.geo import vendor_locator
+from services.cart_store import merge_guest_cart, GUEST_CART_HEADER
 from email_validator import validate_email, EmailNotValidError
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint('auth', __name__)
 
+
+def _merge_guest_cart(user_id):
+    """Carry over the request's guest cart; a failure must not fail the sign-in."""
+    guest_cart_id = request.headers.get(GUEST_CART_HEADER)
+    if not guest_cart_id:
+        return
+    try:
+        merge_guest_cart(user_id, guest_cart_id)
+    except Exception:
+        db.session.rollback()
+        logger.exception('Could not merge guest cart into the cart of user %s', user_id)
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user (customer or vendor)"""
@@ -54,6 +71,8 @@ def register():
             db.session.add(vendor_profile)
             db.session.commit()
         
+        _merge_guest_cart(user.id)
+        
         # Generate tokens
         access_token = create_access_token(identity=str(user.id))
         refresh_token = create_refresh_token(identity=str(user.id))
@@ -86,6 +105,9 @@ def login():
         if not user.is_active:
             return jsonify({'error': 'Account is deactivated'}), 403
         
+        # Carry over anything added to a guest cart before signing in
+        _merge_guest_cart(user.id)
+        
         # Generate tokens
         access_token = create_access_token(identity=str(user.id))
         refresh_token = create_refresh_token(identity=str(user.id))
@@ -154,6 +176,7 @@ def update_profile():
         if 'phone' in data:
             user.phone = data['phone']
         
+        pincode_changed = False
         # Update vendor profile if user is vendor
         if user.role == 'vendor' and user.vendor_profile and 'vendor_profile' in data:
             vp_data = data['vendor_profile']
@@ -169,10 +192,14 @@ def update_profile():
                 user.vendor_profile.city = vp_data['city']
             if 'state' in vp_data:
                 user.vendor_profile.state = vp_data['state']
-            if 'pincode' in vp_data:
+            if 'pincode' in vp_data and vp_data['pincode'] != user.vendor_profile.pincode:
                 user.vendor_profile.pincode = vp_data['pincode']
+                vendor_locator.mark_changed()
+                pincode_changed = True
         
         db.session.commit()
+        if pincode_changed:
+            vendor_locator.refresh()
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -1,147 +1,145 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, CartItem, Product
+from models import db
+from services.cart_store import SQLCartStore, GuestCartStore, CartError, GUEST_CART_HEADER
+from services.idempotency import idempotent
 
 cart_bp = Blueprint('cart', __name__)
 
+def _cart_store():
+    """The signed-in user's cart, or the guest cart named by the X-Guest-Cart-Id header"""
+    user_id = get_jwt_identity()
+    if user_id is not None:
+        return SQLCartStore(int(user_id))
+    return GuestCartStore(request.headers.get(GUEST_CART_HEADER))
+
+def _respond(store, body, status=200):
+    # Guests need their cart id back, including the one minted by their first add
+    if store.is_guest and store.guest_id:
+        body['guest_cart_id'] = store.guest_id
+    response = jsonify(body)
+    if store.is_guest and store.guest_id:
+        response.headers[GUEST_CART_HEADER] = store.guest_id
+    return response, status
+
+def _cart_error(e):
+    body = {'error': str(e)}
+    if e.details:
+        body['details'] = e.details
+    return jsonify(body), e.status
+
 @cart_bp.route('', methods=['GET'])
-@jwt_required()
+@jwt_required(optional=True)
 def get_cart():
-    """Get user's cart items"""
+    """Get cart items (signed-in or guest)"""
     try:
-        user_id = get_jwt_identity()
-        cart_items = CartItem.query.filter_by(user_id=int(user_id)).all()
-        
-        items = [item.to_dict() for item in cart_items]
-        total = sum(item['subtotal'] for item in items)
+        store = _cart_store()
+        return _respond(store, store.payload())
         
-        return jsonify({
-            'items': items,
-            'total': total,
-            'count': len(items)
-        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@cart_bp.route('/summary', methods=['GET'])
+@jwt_required(optional=True)
+def get_cart_summary():
+    """Get cart item count and total only (cached per user)"""
+    try:
+        store = _cart_store()
+        return _respond(store, store.summary())
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('', methods=['POST'])
-@jwt_required()
+@jwt_required(optional=True)
+@idempotent
 def add_to_cart():
     """Add product to cart"""
     try:
-        user_id = get_jwt_identity()
-        user_id = int(user_id)
         data = request.get_json()
         
         if not data.get('product_id'):
             return jsonify({'error': 'Product ID is required'}), 400
         
-        product = Product.query.get(data['product_id'])
-        if not product:
-            return jsonify({'error': 'Product not found'}), 404
-        
-        if not product.is_active or product.stock_quantity <= 0:
-            return jsonify({'error': 'Product is not available'}), 400
-        
-        quantity = data.get('quantity', 1)
-        
-        if quantity > product.stock_quantity:
-            return jsonify({'error': f'Only {product.stock_quantity} items available'}), 400
-        
-        # Check if item already in cart
-        cart_item = CartItem.query.filter_by(
-            user_id=user_id,
-            product_id=data['product_id']
-        ).first()
-        
-        if cart_item:
-            # Update quantity
-            cart_item.quantity += quantity
-            if cart_item.quantity > product.stock_quantity:
-                return jsonify({'error': f'Only {product.stock_quantity} items available'}), 400
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                user_id=user_id,
-                product_id=data['product_id'],
-                quantity=quantity
-            )
-            db.session.add(cart_item)
-        
-        db.session.commit()
-        
-        return jsonify({
+        store = _cart_store()
+        cart_item = store.add(data['product_id'], data.get('quantity', 1))
+        
+        return _respond(store, {
             'message': 'Product added to cart',
-            'cart_item': cart_item.to_dict()
-        }), 201
+            'cart_item': cart_item
+        }, 201)
+        
+    except CartError as e:
+        db.session.rollback()
+        return _cart_error(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@cart_bp.route('', methods=['PATCH'])
+@jwt_required(optional=True)
+def update_cart_batch():
+    """Apply a list of add/set/remove operations in one transaction"""
+    try:
+        data = request.get_json() or {}
+        store = _cart_store()
+        store.apply(data.get('operations'))
         
+        return _respond(store, store.payload())
+        
+    except CartError as e:
+        db.session.rollback()
+        return _cart_error(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/<int:cart_item_id>', methods=['PUT'])
-@jwt_required()
+@jwt_required(optional=True)
 def update_cart_item(cart_item_id):
     """Update cart item quantity"""
     try:
-        user_id = get_jwt_identity()
         data = request.get_json()
         
-        cart_item = CartItem.query.filter_by(id=cart_item_id, user_id=int(user_id)).first()
-        
-        if not cart_item:
-            return jsonify({'error': 'Cart item not found'}), 404
-        
         if 'quantity' not in data:
             return jsonify({'error': 'Quantity is required'}), 400
         
-        quantity = data['quantity']
-        
-        if quantity <= 0:
-            db.session.delete(cart_item)
-        else:
-            if quantity > cart_item.product.stock_quantity:
-                return jsonify({'error': f'Only {cart_item.product.stock_quantity} items available'}), 400
-            cart_item.quantity = quantity
+        store = _cart_store()
+        store.update(cart_item_id, data['quantity'])
         
-        db.session.commit()
-        
-        return jsonify({'message': 'Cart updated successfully'}), 200
+        return _respond(store, {'message': 'Cart updated successfully'})
         
+    except CartError as e:
+        db.session.rollback()
+        return _cart_error(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/<int:cart_item_id>', methods=['DELETE'])
-@jwt_required()
+@jwt_required(optional=True)
 def remove_from_cart(cart_item_id):
     """Remove item from cart"""
     try:
-        user_id = get_jwt_identity()
-        
-        cart_item = CartItem.query.filter_by(id=cart_item_id, user_id=int(user_id)).first()
-        
-        if not cart_item:
-            return jsonify({'error': 'Cart item not found'}), 404
+        store = _cart_store()
+        store.remove(cart_item_id)
         
-        db.session.delete(cart_item)
-        db.session.commit()
-        
-        return jsonify({'message': 'Item removed from cart'}), 200
+        return _respond(store, {'message': 'Item removed from cart'})
         
+    except CartError as e:
+        db.session.rollback()
+        return _cart_error(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/clear', methods=['DELETE'])
-@jwt_required()
+@jwt_required(optional=True)
 def clear_cart():
     """Clear all items from cart"""
     try:
-        user_id = get_jwt_identity()
-        
-        CartItem.query.filter_by(user_id=int(user_id)).delete()
-        db.session.commit()
+        store = _cart_store()
+        store.clear()
         
         return jsonify({'message': 'Cart cleared successfully'}), 200
         
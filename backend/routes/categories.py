@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Category, User
+from services.conditional import conditional_json, make_etag
+from services.category_registry import category_registry
 import re
 
 categories_bp = Blueprint('categories', __name__)
@@ -9,8 +11,8 @@ categories_bp = Blueprint('categories', __name__)
 def get_categories():
     """Get all categories"""
     try:
-        categories = Category.query.filter_by(is_active=True).all()
-        return jsonify([category.to_dict() for category in categories]), 200
+        categories = category_registry.all()
+        return conditional_json(category_registry.etag, None, lambda: categories)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -44,6 +46,7 @@ def create_category():
         )
         db.session.add(category)
         db.session.commit()
+        category_registry.refresh()
         return jsonify({'message': 'Category created', 'category': category.to_dict()}), 201
     except Exception as e:
         db.session.rollback()
@@ -53,9 +56,9 @@ def create_category():
 def get_category(category_id):
     """Get single category"""
     try:
-        category = Category.query.get(category_id)
+        category = category_registry.get(category_id)
         if not category:
             return jsonify({'error': 'Category not found'}), 404
-        return jsonify(category.to_dict()), 200
+        return conditional_json(make_etag(sorted(category.items())), None, lambda: category)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,17 +1,42 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Order, OrderItem, CartItem, Product
+from models import db, Order, OrderItem, CartItem
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload, with_expression
+from services.pagination import keyset_response
+from services.cache import catalog_cache, cart_summary_cache
+from services.inventory import decrement_stock, cancel_orders, OutOfStock, FINAL_ORDER_STATUSES
+from services.reservations import reservations
+from services.tasks import enqueue, task_queue
+from services.idempotency import idempotent
+from services.conditional import conditional_json, make_etag
 from datetime import datetime
 import uuid
 
 orders_bp = Blueprint('orders', __name__)
 
+ORDER_SORT_KEY = [(Order.created_at, True), (Order.id, True)]
+
+def _order_history_options(view):
+    """Summary: item count and first thumbnail computed in the page query. Full: items in one IN query per page."""
+    if view != 'summary':
+        return (selectinload(Order.order_items),)
+    item_count = select(func.count(OrderItem.id)).where(
+        OrderItem.order_id == Order.id
+    ).correlate(Order).scalar_subquery()
+    first_item_image = select(OrderItem.product_image).where(
+        OrderItem.order_id == Order.id
+    ).correlate(Order).order_by(OrderItem.id).limit(1).scalar_subquery()
+    return (with_expression(Order.item_count, item_count),
+            with_expression(Order.first_item_image, first_item_image))
+
 def generate_order_number():
     """Generate unique order number"""
     return f"ORD{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:8].upper()}"
 
 @orders_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_order():
     """Create new order from cart"""
     try:
@@ -27,7 +52,7 @@ def create_order():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Get cart items
-        cart_items = CartItem.query.filter_by(user_id=int(user_id)).all()
+        cart_items = CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=int(user_id)).all()
         
         if not cart_items:
             return jsonify({'error': 'Cart is empty'}), 400
@@ -39,8 +64,8 @@ def create_order():
         for cart_item in cart_items:
             product = cart_item.product
             
-            # Verify product availability
-            if not product.is_active or product.stock_quantity < cart_item.quantity:
+            # Verify product availability (held lines are checked by the guarded decrement below)
+            if not product.is_active or (not reservations.enabled and product.stock_quantity < cart_item.quantity):
                 return jsonify({'error': f'Product {product.name} is not available'}), 400
             
             item_total = product.discounted_price * cart_item.quantity
@@ -92,10 +117,17 @@ def create_order():
                 total_price=item_data['total_price']
             )
             db.session.add(order_item)
-            
-            # Update product stock and sold count
-            item_data['product'].stock_quantity -= item_data['quantity']
-            item_data['product'].sold_count += item_data['quantity']
+        
+        # Guarded decrements: a concurrent checkout may have taken the stock since the check above
+        quantities = {item_data['product'].id: item_data['quantity'] for item_data in order_items_data}
+        try:
+            # Scored at the order's timestamp so a cancellation takes back exactly the same amount
+            decrement_stock(quantities, at=order.created_at, held=reservations.take(user_id, list(quantities)))
+        except OutOfStock as e:
+            name = next(item_data['product'].name for item_data in order_items_data
+                        if item_data['product'].id == e.product_id)
+            db.session.rollback()
+            return jsonify({'error': f'Product {name} is not available'}), 409
         
         # Clear cart
         CartItem.query.filter_by(user_id=user_id).delete()
@@ -105,7 +137,13 @@ def create_order():
             order.payment_status = 'pending'
             order.status = 'confirmed'
         
+        # Side effects run in the background, from a job committed with the order
+        enqueue('order_placed', {'order_id': order.id})
+        
         db.session.commit()
+        catalog_cache.invalidate()  # sold_count changed
+        cart_summary_cache.invalidate(str(user_id))
+        task_queue.wake()
         
         return jsonify({
             'message': 'Order created successfully',
@@ -125,12 +163,28 @@ def get_orders():
         user_id = int(user_id)
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        # summary: headers with item count and thumbnail only; full (default): with line items
+        view = request.args.get('view', 'full')
+        if view not in ('full', 'summary'):
+            return jsonify({'error': 'view must be full or summary'}), 400
+        serialize = Order.to_summary_dict if view == 'summary' else Order.to_dict
+        query = Order.query.filter_by(user_id=user_id).options(*_order_history_options(view))
+        
+        if 'cursor' in request.args:
+            def respond(items, next_cursor):
+                return jsonify({
+                    'orders': [serialize(order) for order in items],
+                    'per_page': per_page,
+                    'next_cursor': next_cursor
+                }), 200
+            
+            return keyset_response(query, ORDER_SORT_KEY, 'created_at', per_page, respond)
         
-        pagination = Order.query.filter_by(user_id=user_id).order_by(
-            Order.created_at.desc()
+        pagination = query.order_by(
+            Order.created_at.desc(), Order.id.desc()
         ).paginate(page=page, per_page=per_page, error_out=False)
         
-        orders = [order.to_dict() for order in pagination.items]
+        orders = [serialize(order) for order in pagination.items]
         
         return jsonify({
             'orders': orders,
@@ -154,13 +208,16 @@ def get_order(order_id):
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
-        return jsonify(order.to_dict()), 200
+        # Line items never change after checkout; status changes bump updated_at
+        etag = make_etag(order.id, order.status, order.payment_status, order.updated_at)
+        return conditional_json(etag, order.updated_at, order.to_dict)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<int:order_id>/cancel', methods=['POST'])
 @jwt_required()
+@idempotent
 def cancel_order(order_id):
     """Cancel an order"""
     try:
@@ -170,19 +227,12 @@ def cancel_order(order_id):
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
-        if order.status in ['delivered', 'cancelled']:
+        # Guarded status change, then one batched stock restore; a concurrent cancel finds nothing to do
+        if order.status in FINAL_ORDER_STATUSES or not cancel_orders([order.id]):
             return jsonify({'error': 'Order cannot be cancelled'}), 400
         
-        order.status = 'cancelled'
-        
-        # Restore product stock
-        for item in order.order_items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.stock_quantity += item.quantity
-                product.sold_count -= item.quantity
-        
         db.session.commit()
+        catalog_cache.invalidate()  # sold_count changed
         
         return jsonify({
             'message': 'Order cancelled successfully',
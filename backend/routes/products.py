@@ -1,11 +1,46 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from models import db, Product, Category
-from datetime import datetime, date
-from sqlalchemy import or_, and_
+from models import Product, product_load_options
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from services import search as product_search
+from services.pagination import keyset_response
+from services.cache import catalog_cache
+from services.view_counter import view_counter
+from services.facets import compute_facets
+from services.conditional import conditional_json, make_etag, latest, start_of_today
+from services.suggest import suggester
+from services.expiry import expiring_within, utc_today
+from services.geo import vendor_locator, UnknownPincode
+from services.feed import ndjson_chunks, gzip_chunks
 
 products_bp = Blueprint('products', __name__)
 
+# sort_by -> [(column, descending)], always ending with the id tiebreaker
+PRODUCT_SORT_KEYS = {
+    'created_at': [(Product.created_at, True), (Product.id, True)],
+    'price_low': [(Product.discounted_price, False), (Product.id, False)],
+    'price_high': [(Product.discounted_price, True), (Product.id, True)],
+    'expiry': [(Product.expiry_date, False), (Product.id, False)],
+    'popular': [(Product.sold_count, True), (Product.id, True)],
+}
+
+# Largest id list accepted by /batch
+PRODUCT_BATCH_MAX = 100
+
+def _product_version(product):
+    """Everything Product.to_dict shows that can change, except the buffered views_count"""
+    return (
+        product.id,
+        product.updated_at,
+        product.vendor.business_name if product.vendor else None,
+        product.get_category_name()
+    )
+
+def _listing_etag(items, *parts):
+    # No Last-Modified: a row dropping out of the page would not move it forward
+    return make_etag(request.query_string, start_of_today(), parts, [_product_version(p) for p in items])
+
 @products_bp.route('', methods=['GET'])
 def get_products():
     """Get all products with filtering, search, and pagination"""
@@ -16,61 +51,178 @@ def get_products():
         category_id = request.args.get('category_id', type=int)
         min_price = request.args.get('min_price', type=float)
         max_price = request.args.get('max_price', type=float)
-        sort_by = request.args.get('sort_by', 'created_at')  # created_at, price_low, price_high, expiry, popular
+        # created_at, price_low, price_high, expiry, popular, relevance (default when searching)
+        sort_by = request.args.get('sort_by', 'relevance' if search else 'created_at')
         days_to_expiry = request.args.get('days_to_expiry', type=int)
+        near_pincode = request.args.get('near_pincode', '').strip()
+        radius_km = request.args.get('radius_km', current_app.config['NEAR_PINCODE_DEFAULT_RADIUS_KM'], type=float)
+        with_facets = request.args.get('facets', '').lower() in ('1', 'true', 'yes')
+        
+        today = utc_today()
         
-        # Base query - only active products
-        query = Product.query.filter_by(is_active=True)
+        # Base query - only active products that have not expired yet
+        query = Product.query.filter(Product.is_active == True, Product.expiry_date >= today)
         
-        # Search filter
+        # Full-text search filter
+        search_rank = None
         if search:
-            search_filter = or_(
-                Product.name.ilike(f'%{search}%'),
-                Product.description.ilike(f'%{search}%'),
-                Product.brand.ilike(f'%{search}%')
-            )
-            query = query.filter(search_filter)
+            query, search_rank = product_search.apply_search(query, search)
         
         # Category filter
         if category_id:
             query = query.filter_by(category_id=category_id)
         
+        # Proximity filter: vendor ids come from the in-memory grid, not per-row distance math
+        if near_pincode:
+            max_radius = current_app.config['NEAR_PINCODE_MAX_RADIUS_KM']
+            if not 0 < radius_km <= max_radius:
+                return jsonify({'error': f'radius_km must be between 0 and {max_radius}'}), 400
+            try:
+                vendor_ids = vendor_locator.vendors_near(near_pincode, radius_km)
+            except UnknownPincode as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(Product.vendor_id.in_(vendor_ids))
+        
         # Price filters
         if min_price is not None:
             query = query.filter(Product.discounted_price >= min_price)
         if max_price is not None:
             query = query.filter(Product.discounted_price <= max_price)
         
-        # Days to expiry filter
+        # Days to expiry filter, narrowed by the indexed expiry bucket
         if days_to_expiry is not None:
-            target_date = date.today()
-            from datetime import timedelta
-            expiry_before = target_date + timedelta(days=days_to_expiry)
-            query = query.filter(Product.expiry_date <= expiry_before)
+            query = query.filter(expiring_within(days_to_expiry, today))
+        
+        # Facet counts for the current filter set, from one grouped query
+        facets = compute_facets(query, today) if with_facets else None
+        
+        # Vendor and category are joined in for serialization
+        query = query.options(*product_load_options())
+        
+        if 'cursor' in request.args:
+            if sort_by not in PRODUCT_SORT_KEYS:
+                if 'sort_by' not in request.args:
+                    # Relevance is only the default when searching; page search results by recency instead
+                    sort_by = 'created_at'
+                else:
+                    return jsonify({'error': f'Cursor pagination is not supported for sort_by={sort_by}; '
+                                             f'use one of {", ".join(PRODUCT_SORT_KEYS)}'}), 400
+            
+            def respond(items, next_cursor):
+                def build_page():
+                    response = {
+                        'products': [product.to_dict(today) for product in items],
+                        'per_page': per_page,
+                        'next_cursor': next_cursor
+                    }
+                    if facets is not None:
+                        response['facets'] = facets
+                    return response
+                return conditional_json(_listing_etag(items, next_cursor, facets), None, build_page)
+            
+            return keyset_response(query, PRODUCT_SORT_KEYS[sort_by], sort_by, per_page, respond)
         
         # Sorting
-        if sort_by == 'price_low':
-            query = query.order_by(Product.discounted_price.asc())
-        elif sort_by == 'price_high':
-            query = query.order_by(Product.discounted_price.desc())
-        elif sort_by == 'expiry':
-            query = query.order_by(Product.expiry_date.asc())
-        elif sort_by == 'popular':
-            query = query.order_by(Product.sold_count.desc())
+        if sort_by == 'relevance' and search_rank is not None:
+            query = query.order_by(search_rank, Product.id.desc())
         else:
-            query = query.order_by(Product.created_at.desc())
+            order = PRODUCT_SORT_KEYS.get(sort_by, PRODUCT_SORT_KEYS['created_at'])
+            query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
         
         # Pagination
         pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        products = [product.to_dict() for product in pagination.items]
         
-        return jsonify({
-            'products': products,
-            'total': pagination.total,
-            'page': page,
-            'per_page': per_page,
-            'pages': pagination.pages
-        }), 200
+        def build_page():
+            response = {
+                'products': [product.to_dict(today) for product in pagination.items],
+                'total': pagination.total,
+                'page': page,
+                'per_page': per_page,
+                'pages': pagination.pages
+            }
+            if facets is not None:
+                response['facets'] = facets
+            return response
+        
+        return conditional_json(_listing_etag(pagination.items, pagination.total, facets), None, build_page)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/suggest', methods=['GET'])
+def suggest_products():
+    """Autocomplete product names, brands and categories (served from memory)"""
+    try:
+        q = request.args.get('q', '')
+        limit = max(1, request.args.get('limit', 8, type=int))
+        return jsonify({'suggestions': suggester.suggest(q, limit)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/batch', methods=['GET'])
+def get_products_batch():
+    """Get several products by id in one query (not counted as views)"""
+    try:
+        try:
+            ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return jsonify({'error': 'ids is required'}), 400
+        if len(ids) > PRODUCT_BATCH_MAX:
+            return jsonify({'error': f'At most {PRODUCT_BATCH_MAX} ids per request'}), 400
+        
+        found = {
+            product.id: product
+            for product in Product.query.options(*product_load_options()).filter(Product.id.in_(ids))
+        }
+        products = [found[product_id] for product_id in ids if product_id in found]
+        
+        today = start_of_today()
+        
+        def build():
+            return {
+                'products': [product.to_dict(today.date()) for product in products],
+                'missing': [product_id for product_id in ids if product_id not in found]
+            }
+        
+        etag = make_etag(today, ids, [_product_version(product) for product in products])
+        return conditional_json(etag, None, build)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/feed', methods=['GET'])
+def get_product_feed():
+    """Stream the catalog (or products changed since ``since``) as NDJSON"""
+    try:
+        since = request.args.get('since')
+        if since:
+            try:
+                since = datetime.fromisoformat(since.replace('Z', '+00:00'))
+            except ValueError:
+                return jsonify({'error': 'since must be an ISO 8601 timestamp'}), 400
+            if since.tzinfo is not None:
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            since -= timedelta(seconds=current_app.config['FEED_SINCE_OVERLAP'])
+        
+        generated_at = datetime.utcnow()
+        today = generated_at.date()
+        # A 2.0-style select: legacy Query de-duplicates joined eager loads, which rules out yield_per
+        statement = select(Product).options(*product_load_options())
+        if since:
+            statement = statement.where(Product.updated_at > since).order_by(Product.updated_at, Product.id)
+        else:
+            statement = statement.where(Product.is_active == True, Product.expiry_date >= today).order_by(Product.id)
+        
+        chunks = ndjson_chunks(statement, lambda product: product.to_dict(today), current_app.config['FEED_BATCH_SIZE'])
+        headers = {'X-Feed-Generated-At': generated_at.isoformat() + 'Z', 'Vary': 'Accept-Encoding'}
+        if 'gzip' in request.accept_encodings:
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        
+        return Response(stream_with_context(chunks), mimetype='application/x-ndjson', headers=headers)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -79,16 +231,17 @@ def get_products():
 def get_product(product_id):
     """Get single product details"""
     try:
-        product = Product.query.get(product_id)
+        product = Product.query.options(*product_load_options()).get(product_id)
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Increment view count
-        product.views_count += 1
-        db.session.commit()
+        # Buffered and written in batches, so this stays a pure read
+        view_counter.record(product.id)
         
-        return jsonify(product.to_dict()), 200
+        today = start_of_today()
+        return conditional_json(make_etag(today, _product_version(product)),
+                                latest(today, product.updated_at), product.to_dict)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -100,32 +253,40 @@ def get_featured_products():
         limit = request.args.get('limit', 10, type=int)
         
         # Get products expiring in next 7 days with highest discounts
-        from datetime import timedelta
-        expiry_date = date.today() + timedelta(days=7)
+        today = utc_today()
         
-        products = Product.query.filter(
-            Product.is_active == True,
-            Product.expiry_date <= expiry_date,
-            Product.stock_quantity > 0
-        ).order_by(Product.discount_percentage.desc()).limit(limit).all()
+        def load():
+            products = Product.query.options(*product_load_options()).filter(
+                Product.is_active == True,
+                expiring_within(7, today),
+                Product.stock_quantity > 0
+            ).order_by(Product.discount_percentage.desc()).limit(limit).all()
+            return [product.to_dict(today) for product in products]
         
-        return jsonify([product.to_dict() for product in products]), 200
+        return jsonify(catalog_cache.get_or_set(f'featured:{limit}', load)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/trending', methods=['GET'])
 def get_trending_products():
-    """Get trending products (most viewed and sold recently)"""
+    """Get trending products (most viewed and sold recently, with time decay)"""
     try:
         limit = request.args.get('limit', 10, type=int)
         
-        products = Product.query.filter_by(is_active=True).order_by(
-            Product.sold_count.desc(),
-            Product.views_count.desc()
-        ).limit(limit).all()
+        today = utc_today()
+        
+        def load():
+            products = Product.query.options(*product_load_options()).filter(
+                Product.is_active == True,
+                Product.expiry_date >= today
+            ).order_by(
+                Product.trending_score.desc(),
+                Product.id.desc()
+            ).limit(limit).all()
+            return [product.to_dict(today) for product in products]
         
-        return jsonify([product.to_dict() for product in products]), 200
+        return jsonify(catalog_cache.get_or_set(f'trending:{limit}', load)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
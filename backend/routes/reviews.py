@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Review, Product, Order, OrderItem
+from sqlalchemy import func
+from services.conditional import conditional_json, make_etag
 
 reviews_bp = Blueprint('reviews', __name__)
 
@@ -8,10 +10,19 @@ reviews_bp = Blueprint('reviews', __name__)
 def get_product_reviews(product_id):
     """Get all reviews for a product"""
     try:
-        reviews = Review.query.filter_by(product_id=product_id).order_by(
-            Review.created_at.desc()
-        ).all()
-        return jsonify([review.to_dict() for review in reviews]), 200
+        # Reviews are only ever added or deleted, so count + newest row identify the list
+        count, max_id, last_created = db.session.query(
+            func.count(Review.id), func.max(Review.id), func.max(Review.created_at)
+        ).filter(Review.product_id == product_id).one()
+        
+        def build():
+            reviews = Review.query.filter_by(product_id=product_id).order_by(
+                Review.created_at.desc()
+            ).all()
+            return [review.to_dict() for review in reviews]
+        
+        # ETag only: deleting the newest review would move a Last-Modified backwards
+        return conditional_json(make_etag(product_id, count, max_id, last_created), None, build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,13 +1,26 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, VendorProfile, Product, Order, OrderItem
+from models import db, User, VendorProfile, Product, Order, OrderItem, product_load_options
+from services import search as product_search
+from services.pagination import keyset_response
+from services.cache import catalog_cache, cart_summary_cache
+from services.suggest import suggester
+from services.inventory import cancel_orders, FINAL_ORDER_STATUSES
+from services.idempotency import idempotent
 from datetime import datetime, date
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
 from werkzeug.utils import secure_filename
 import os
 import time
 
 vendor_bp = Blueprint('vendor', __name__)
 
+VENDOR_PRODUCT_SORT_KEY = [(Product.created_at, True), (Product.id, True)]
+
+# Most orders one bulk cancel request may name
+BULK_CANCEL_MAX = 500
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config.get('ALLOWED_EXTENSIONS', set())
 
@@ -37,9 +50,20 @@ def get_vendor_products():
         
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        
-        pagination = Product.query.filter_by(vendor_id=user.vendor_profile.id).order_by(
-            Product.created_at.desc()
+        query = Product.query.options(*product_load_options()).filter_by(vendor_id=user.vendor_profile.id)
+        
+        if 'cursor' in request.args:
+            def respond(items, next_cursor):
+                return jsonify({
+                    'products': [product.to_dict() for product in items],
+                    'per_page': per_page,
+                    'next_cursor': next_cursor
+                }), 200
+            
+            return keyset_response(query, VENDOR_PRODUCT_SORT_KEY, 'created_at', per_page, respond)
+        
+        pagination = query.order_by(
+            Product.created_at.desc(), Product.id.desc()
         ).paginate(page=page, per_page=per_page, error_out=False)
         
         products = [product.to_dict() for product in pagination.items]
@@ -151,7 +175,11 @@ def create_product():
         )
         
         db.session.add(product)
+        db.session.flush()  # Get product ID
+        product_search.index_product(product)
         db.session.commit()
+        catalog_cache.invalidate()
+        suggester.upsert_product(product)
         
         return jsonify({'message': 'Product created successfully', 'product': product.to_dict()}), 201
         
@@ -246,7 +274,11 @@ def update_product(product_id):
                 return jsonify({'error': 'discounted_price cannot exceed original_price'}), 400
             product.discount_percentage = ((product.original_price - product.discounted_price) / product.original_price) * 100
         
+        product_search.index_product(product)
         db.session.commit()
+        catalog_cache.invalidate()
+        cart_summary_cache.invalidate()  # cart totals use the current price
+        suggester.upsert_product(product)
         
         return jsonify({'message': 'Product updated successfully', 'product': product.to_dict()}), 200
         
@@ -270,8 +302,12 @@ def delete_product(product_id):
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
+        product_search.remove_product(product.id)
         db.session.delete(product)
         db.session.commit()
+        catalog_cache.invalidate()
+        cart_summary_cache.invalidate()  # deleting a product removes it from carts
+        suggester.remove_product(product_id)
         
         return jsonify({'message': 'Product deleted successfully'}), 200
         
@@ -306,6 +342,74 @@ def get_vendor_orders():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@vendor_bp.route('/orders/cancel', methods=['POST'])
+@jwt_required()
+@idempotent
+def bulk_cancel_orders():
+    """Cancel many of the vendor's open orders in one transaction"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(int(user_id))
+        
+        if not user or user.role != 'vendor' or not user.vendor_profile:
+            return jsonify({'error': 'Vendor profile not found'}), 404
+        
+        data = request.get_json() or {}
+        order_ids = data.get('order_ids')
+        product_id = data.get('product_id')
+        vendor_items = OrderItem.query.join(Product, Product.id == OrderItem.product_id).filter(
+            Product.vendor_id == user.vendor_profile.id
+        )
+        
+        if product_id is not None:
+            if not isinstance(product_id, int):
+                return jsonify({'error': 'product_id must be an integer'}), 400
+            vendor_items = vendor_items.filter(OrderItem.product_id == product_id)
+            order_ids = None
+        elif not isinstance(order_ids, list) or not order_ids or \
+                not all(isinstance(order_id, int) for order_id in order_ids):
+            return jsonify({'error': 'order_ids must be a non-empty list of integers, or pass product_id'}), 400
+        elif len(order_ids) > BULK_CANCEL_MAX:
+            return jsonify({'error': f'At most {BULK_CANCEL_MAX} orders per request'}), 400
+        else:
+            order_ids = list(dict.fromkeys(order_ids))
+            vendor_items = vendor_items.filter(OrderItem.order_id.in_(order_ids))
+        
+        # Does the order also have lines from another vendor (or from a deleted product)?
+        other_item, other_product = aliased(OrderItem), aliased(Product)
+        shared = db.session.query(other_item.id).outerjoin(
+            other_product, other_product.id == other_item.product_id
+        ).filter(
+            other_item.order_id == OrderItem.order_id,
+            or_(other_product.vendor_id.is_(None), other_product.vendor_id != user.vendor_profile.id)
+        ).exists()
+        
+        # Open orders this vendor has items in, and whether each is shared, from one query
+        candidates = vendor_items.join(Order, Order.id == OrderItem.order_id).filter(
+            Order.status.notin_(FINAL_ORDER_STATUSES)
+        ).with_entities(OrderItem.order_id, shared).distinct().order_by(OrderItem.order_id).limit(
+            BULK_CANCEL_MAX + 1
+        ).all()
+        if len(candidates) > BULK_CANCEL_MAX:
+            return jsonify({'error': f'At most {BULK_CANCEL_MAX} orders per request'}), 400
+        
+        cancelled = cancel_orders([order_id for order_id, is_shared in candidates if not is_shared])
+        db.session.commit()
+        if cancelled:
+            catalog_cache.invalidate()  # stock and sold_count changed
+        
+        done = set(cancelled)
+        requested = order_ids if order_ids is not None else [order_id for order_id, _ in candidates]
+        return jsonify({
+            'message': f'{len(cancelled)} orders cancelled',
+            'cancelled': cancelled,
+            'skipped': [order_id for order_id in requested if order_id not in done]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @vendor_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard_stats():
@@ -0,0 +1,65 @@
+"""Periodic background jobs run on daemon threads inside each worker.
+
+Threads are only started when ``BACKGROUND_TASKS_ENABLED`` is set, so CLI
+processes that just load the app (``init_db.py``, ``flask db ...``) exit
+without starting them. ``run_once()`` works either way.
+"""
+import logging
+import threading
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def end_read():
+    """End the session's read transaction before a job writes on its own connection.
+
+    SQLite allows one writer, and an open read on the session would block it.
+    """
+    db.session.rollback()
+
+
+class PeriodicTask:
+    """Call ``func`` every ``interval`` seconds inside an app context.
+
+    ``wake()`` runs the task early, e.g. when a buffer fills up.
+    """
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._app = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self, app):
+        self._app = app
+        if not app.config.get('BACKGROUND_TASKS_ENABLED', True):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def run_once(self):
+        with self._app.app_context():
+            try:
+                self.func()
+            except Exception:
+                logger.exception('Background task %s failed', self.name)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            self.run_once()
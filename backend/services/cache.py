@@ -0,0 +1,260 @@
+"""TTL caches for read-heavy endpoints.
+
+By default each cache is an in-process LRU, i.e. one copy per gunicorn
+worker; an invalidation only clears the worker that made the write, and the
+short TTL bounds how stale the other workers can be. Setting
+``RESPONSE_CACHE_BACKEND = 'sqlite'`` stores entries in a local SQLite file
+instead, so all workers on the host share entries and invalidations.
+Caches created with ``shared=True`` always use that file: their entries
+must not outlive a write made through another worker.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from services.background import PeriodicTask
+
+_caches = {}
+_purge_task = None
+
+
+class MemoryBackend:
+    """Thread-safe LRU dict with per-entry expiry."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def update(self, key, change, ttl):
+        """Replace the value with ``change(value)`` atomically; None deletes. Returns the new value."""
+        with self._lock:
+            entry = self._entries.get(key)
+            value = entry[0] if entry is not None and entry[1] > time.monotonic() else None
+            value = change(value)
+            if value is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = (value, time.monotonic() + ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            return value
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def purge_expired(self):
+        """Drop expired entries now rather than when they are next read. Returns how many."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Cache entries in a SQLite file shared by every worker on the host.
+
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + ttl)
+        )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def update(self, key, change, ttl):
+        """Replace the value with ``change(value)`` atomically; None deletes. Returns the new value.
+
+        BEGIN IMMEDIATE takes the file's write lock before the read, so
+        concurrent updates from other workers queue instead of overwriting
+        each other. Keep ``change`` short.
+        """
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+            value = change(json.loads(row[0]) if row else None)
+            if value is None:
+                connection.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            else:
+                connection.execute(
+                    'INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), time.time() + ttl)
+                )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete_prefix(self, prefix):
+        # Keys are namespaced as "<cache>:<key>", so a range scan on the primary key works
+        self._connection().execute(
+            'DELETE FROM cache_entries WHERE (key >= ? AND key < ?) OR expires_at <= ?',
+            (prefix, prefix + '\uffff', time.time())
+        )
+
+    def purge_expired(self):
+        """Delete expired rows; nothing else removes keys that are never read or invalidated again."""
+        return self._connection().execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),)).rowcount
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+
+class TTLCache:
+    """A named cache with hit/miss counters.
+
+    Create caches at import time; ``init_app`` picks the backend and TTL from
+    the app config.
+    """
+
+    def __init__(self, name, ttl=None, shared=False):
+        self.name = name
+        self.ttl = ttl
+        self.shared = shared
+        self.backend = MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._stats_lock = threading.Lock()
+        _caches[name] = self
+
+    def _key(self, key):
+        return f'{self.name}:{key}'
+
+    def get(self, key):
+        value = self.backend.get(self._key(key))
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(self._key(key), value, self.ttl)
+
+    def get_or_set(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one entry, or the whole cache when ``key`` is None."""
+        with self._stats_lock:
+            self.invalidations += 1
+        if key is None:
+            self.backend.delete_prefix(self._key(''))
+        else:
+            self.backend.delete(self._key(key))
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+            'invalidations': invalidations,
+            'size': len(self.backend) if isinstance(self.backend, MemoryBackend) else None
+        }
+
+
+def init_app(app):
+    global _purge_task
+    use_sqlite = app.config.get('RESPONSE_CACHE_BACKEND', 'memory') == 'sqlite'
+    shared = None
+    if use_sqlite or any(cache.shared for cache in _caches.values()):
+        shared = SQLiteBackend(app.config['RESPONSE_CACHE_PATH'])
+    for cache in _caches.values():
+        if use_sqlite or cache.shared:
+            cache.backend = shared
+        else:
+            cache.backend = MemoryBackend(app.config.get('RESPONSE_CACHE_MAXSIZE', 256))
+        if cache.ttl is None:
+            cache.ttl = app.config.get('RESPONSE_CACHE_TTL', 30)
+    if _purge_task is not None:
+        _purge_task.stop()
+        _purge_task = None
+    if shared is not None:
+        _purge_task = PeriodicTask('response-cache-purge', app.config.get('RESPONSE_CACHE_PURGE_INTERVAL', 600),
+                                   shared.purge_expired)
+        _purge_task.start(app)
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+# Homepage /featured and /trending payloads, keyed by endpoint and limit
+catalog_cache = TTLCache('catalog')
+
+# Per-user cart count and total for the navbar badge, keyed by user id. Shared,
+# since a user's next request after a cart change may land on another worker.
+cart_summary_cache = TTLCache('cart_summary', shared=True)
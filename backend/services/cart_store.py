@@ -0,0 +1,479 @@
+"""Cart storage behind the cart routes.
+
+Signed-in users keep their cart in ``cart_items`` (``SQLCartStore``).
+Anonymous visitors get a guest cart (``GuestCartStore``) identified by an
+opaque id the client sends back in the ``X-Guest-Cart-Id`` header. Guest
+carts never touch the primary database except to read products: they live
+in a local store chosen by ``GUEST_CART_BACKEND`` -- ``sqlite`` (a file
+shared by the workers on the host, the default) or ``memory`` (one worker
+only, for development). They expire after ``GUEST_CART_TTL`` seconds of
+inactivity (expired carts are purged every ``GUEST_CART_PURGE_INTERVAL``
+seconds) and are merged into the user's cart on login or registration.
+
+Both stores return the same shapes; guest cart item ids are product ids.
+With ``STOCK_RESERVATIONS_ENABLED`` every signed-in cart change also moves
+the user's stock hold (services/reservations.py) in the same transaction.
+"""
+import logging
+import re
+import secrets
+from datetime import datetime
+from sqlalchemy import func, literal, select
+from sqlalchemy.orm import contains_eager
+from models import db, CartItem, Product, product_load_options, upsert_insert
+from services.background import PeriodicTask
+from services.cache import MemoryBackend, SQLiteBackend, cart_summary_cache
+from services.expiry import utc_today
+from services.inventory import OutOfStock
+from services.reservations import reservations
+
+logger = logging.getLogger(__name__)
+
+GUEST_CART_HEADER = 'X-Guest-Cart-Id'
+GUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+# Largest operation list accepted by apply()
+CART_BATCH_MAX = 100
+
+_guest_backend = MemoryBackend(10000)
+_guest_ttl = 7 * 24 * 3600
+_purge_task = None
+
+
+class CartError(ValueError):
+    """A cart change that cannot be made; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def init_app(app):
+    global _guest_backend, _guest_ttl, _purge_task
+    if app.config.get('GUEST_CART_BACKEND', 'sqlite') == 'sqlite':
+        _guest_backend = SQLiteBackend(app.config['GUEST_CART_PATH'])
+    else:
+        _guest_backend = MemoryBackend(app.config.get('GUEST_CART_MAXSIZE', 10000))
+    _guest_ttl = app.config.get('GUEST_CART_TTL', _guest_ttl)
+    if _purge_task is not None:
+        _purge_task.stop()
+    _purge_task = PeriodicTask('guest-cart-purge', app.config.get('GUEST_CART_PURGE_INTERVAL', 3600),
+                               purge_expired_guest_carts)
+    _purge_task.start(app)
+
+
+def purge_expired_guest_carts():
+    """Delete abandoned guest carts whose TTL has run out."""
+    purged = _guest_backend.purge_expired()
+    if purged:
+        logger.info('Purged %d expired guest carts', purged)
+    return purged
+
+
+def _line_total():
+    return Product.discounted_price * CartItem.quantity
+
+
+def _availability_error(product, quantity, held=0):
+    """Why ``quantity`` of ``product`` cannot be in a cart that already holds ``held`` units, or None."""
+    if not product:
+        return CartError('Product not found', 404)
+    available = product.available_quantity + held
+    if not product.is_active or available <= 0:
+        return CartError('Product is not available')
+    if quantity > available:
+        return CartError(f'Only {available} items available')
+    return None
+
+
+def _check_quantity(quantity, minimum=None):
+    if not isinstance(quantity, int) or isinstance(quantity, bool):
+        raise CartError('Quantity must be an integer')
+    if minimum is not None and quantity < minimum:
+        raise CartError('Quantity must be a positive integer' if minimum else 'Quantity must be a non-negative integer')
+
+
+def resolve_operations(quantities, operations):
+    """Validate add/set/remove operations and apply them to ``{product_id: quantity}``.
+
+    Returns the new quantities and the set of product ids the operations touched.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartError('operations must be a non-empty list')
+    if len(operations) > CART_BATCH_MAX:
+        raise CartError(f'At most {CART_BATCH_MAX} operations per request')
+
+    quantities = dict(quantities)
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in ('add', 'set', 'remove'):
+            raise CartError(f'Operation {i}: op must be add, set or remove')
+        product_id = operation.get('product_id')
+        if not isinstance(product_id, int):
+            raise CartError(f'Operation {i}: product_id is required')
+        try:
+            if operation['op'] == 'add':
+                quantity = operation.get('quantity', 1)
+                _check_quantity(quantity, 1)
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            elif operation['op'] == 'set':
+                quantity = operation.get('quantity')
+                _check_quantity(quantity, 0)
+                quantities[product_id] = quantity
+            else:
+                quantities[product_id] = 0
+        except CartError as e:
+            raise CartError(f'Operation {i}: {e}')
+    return quantities, {operation['product_id'] for operation in operations}
+
+
+def _check_stock(quantities, touched, held=None):
+    """One query for every touched product; raise with per-product details if any is short.
+
+    ``held`` is ``{product_id: quantity}`` already reserved by the cart's owner.
+    """
+    held = held or {}
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(touched))}
+    errors = []
+    for product_id in sorted(touched):
+        if quantities[product_id] > 0:
+            error = _availability_error(products.get(product_id), quantities[product_id], held.get(product_id, 0))
+            if error:
+                errors.append({'product_id': product_id, 'error': str(error)})
+    if errors:
+        raise CartError('Some operations could not be applied', details=errors)
+
+
+class SQLCartStore:
+    """A signed-in user's cart in ``cart_items``."""
+
+    is_guest = False
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def payload(self):
+        """Items, products, vendors and line totals in one joined query"""
+        rows = db.session.query(CartItem, _line_total()).join(CartItem.product).options(
+            contains_eager(CartItem.product).joinedload(Product.vendor)
+        ).filter(CartItem.user_id == self.user_id).order_by(CartItem.id).all()
+
+        today = utc_today()
+        items = [item.to_dict(today, subtotal) for item, subtotal in rows]
+        return {
+            'items': items,
+            'total': sum(subtotal for _, subtotal in rows),
+            'count': len(items)
+        }
+
+    def summary(self):
+        def load():
+            count, total = db.session.query(
+                func.count(CartItem.id), func.coalesce(func.sum(_line_total()), 0)
+            ).join(CartItem.product).filter(CartItem.user_id == self.user_id).one()
+            return {'count': count, 'total': total}
+
+        return cart_summary_cache.get_or_set(str(self.user_id), load)
+
+    def _changed(self):
+        db.session.commit()
+        cart_summary_cache.invalidate(str(self.user_id))
+
+    def _hold(self, quantities):
+        """Match the user's stock holds to the new line quantities (a no-op with reservations off)."""
+        try:
+            reservations.hold(self.user_id, quantities)
+        except OutOfStock as e:
+            db.session.rollback()
+            product = db.session.get(Product, e.product_id)
+            raise self._availability_error(product, quantities[e.product_id]) or \
+                CartError(f'Only {reservations.available_to(self.user_id, product)} items available')
+
+    def _availability_error(self, product, quantity):
+        held = reservations.held(self.user_id, [product.id]).get(product.id, 0) if product else 0
+        return _availability_error(product, quantity, held)
+
+    def _add_statement(self, product_id, quantity):
+        """Insert a cart line or add to its quantity, in one statement, only if stock allows.
+
+        INSERT ... SELECT FROM products (so missing, inactive or short-stock products
+        insert nothing) ... ON CONFLICT (user_id, product_id) DO UPDATE WHERE the new
+        total is still in stock. Returns the cart item id, or no row if nothing changed.
+        """
+        insert = upsert_insert()
+        now = datetime.utcnow()
+
+        source = select(
+            literal(self.user_id), Product.id, literal(quantity), literal(now), literal(now)
+        ).where(
+            Product.id == product_id,
+            Product.is_active == True,
+            Product.stock_quantity >= quantity
+        )
+        statement = insert(CartItem.__table__).from_select(
+            ['user_id', 'product_id', 'quantity', 'created_at', 'updated_at'], source
+        )
+        stock = select(Product.stock_quantity).where(Product.id == product_id).scalar_subquery()
+        return statement.on_conflict_do_update(
+            index_elements=['user_id', 'product_id'],
+            set_={
+                'quantity': CartItem.__table__.c.quantity + statement.excluded.quantity,
+                'updated_at': statement.excluded.updated_at
+            },
+            where=CartItem.__table__.c.quantity + statement.excluded.quantity <= stock
+        ).returning(CartItem.__table__.c.id, CartItem.__table__.c.quantity)
+
+    def add(self, product_id, quantity):
+        _check_quantity(quantity, 1)
+        row = db.session.execute(self._add_statement(product_id, quantity)).first()
+
+        if row is None:
+            # Nothing was written: work out why for the error message
+            db.session.rollback()
+            product = db.session.get(Product, product_id)
+            in_cart = db.session.query(CartItem.quantity).filter_by(user_id=self.user_id, product_id=product_id).scalar()
+            # Stock may have come back since the guarded write; don't guess, ask for a retry
+            raise self._availability_error(product, quantity + (in_cart or 0)) or \
+                CartError('Stock changed while adding this product; please try again', 409)
+
+        cart_item_id, total = row
+        self._hold({product_id: total})
+        self._changed()
+        cart_item = CartItem.query.options(*product_load_options(CartItem.product)).get(cart_item_id)
+        return cart_item.to_dict()
+
+    def update(self, item_id, quantity):
+        _check_quantity(quantity)
+        cart_item = CartItem.query.filter_by(id=item_id, user_id=self.user_id).first()
+        if not cart_item:
+            raise CartError('Cart item not found', 404)
+
+        if quantity <= 0:
+            db.session.delete(cart_item)
+        else:
+            error = self._availability_error(cart_item.product, quantity)
+            if error:
+                raise error
+            cart_item.quantity = quantity
+        self._hold({cart_item.product_id: max(quantity, 0)})
+        self._changed()
+
+    def remove(self, item_id):
+        cart_item = CartItem.query.filter_by(id=item_id, user_id=self.user_id).first()
+        if not cart_item:
+            raise CartError('Cart item not found', 404)
+        db.session.delete(cart_item)
+        self._hold({cart_item.product_id: 0})
+        self._changed()
+
+    def clear(self):
+        if reservations.enabled:
+            product_ids = [product_id for (product_id,) in
+                           db.session.query(CartItem.product_id).filter_by(user_id=self.user_id)]
+            self._hold(dict.fromkeys(product_ids, 0))
+        CartItem.query.filter_by(user_id=self.user_id).delete()
+        self._changed()
+
+    def apply(self, operations):
+        existing = {item.product_id: item for item in CartItem.query.filter_by(user_id=self.user_id)}
+        quantities, touched = resolve_operations(
+            {product_id: item.quantity for product_id, item in existing.items()}, operations
+        )
+        _check_stock(quantities, touched, reservations.held(self.user_id, touched))
+
+        for product_id in touched:
+            quantity = quantities[product_id]
+            item = existing.get(product_id)
+            if quantity <= 0:
+                if item:
+                    db.session.delete(item)
+            elif item:
+                item.quantity = quantity
+            else:
+                db.session.add(CartItem(user_id=self.user_id, product_id=product_id, quantity=quantity))
+        try:
+            reservations.hold(self.user_id, {product_id: max(quantities[product_id], 0) for product_id in touched})
+        except OutOfStock as e:
+            db.session.rollback()
+            product = db.session.get(Product, e.product_id)
+            raise CartError('Some operations could not be applied', details=[{
+                'product_id': e.product_id,
+                'error': f'Only {reservations.available_to(self.user_id, product)} items available'
+            }])
+        self._changed()
+
+    def merge(self, lines):
+        """Add ``{product_id: quantity}`` lines, clamped to stock, with one upsert batch.
+
+        Unavailable products (including ones fully held by other carts) are skipped.
+        A fixed number of statements whatever the cart size.
+        """
+        if not lines:
+            return
+        stock = dict(db.session.query(Product.id, Product.stock_quantity - Product.reserved_quantity).filter(
+            Product.id.in_(lines), Product.is_active == True, Product.stock_quantity > 0
+        ))
+        for product_id, quantity in reservations.held(self.user_id, list(stock)).items():
+            stock[product_id] += quantity
+        in_cart = dict(db.session.query(CartItem.product_id, CartItem.quantity).filter(
+            CartItem.user_id == self.user_id, CartItem.product_id.in_(stock)
+        ))
+        now = datetime.utcnow()
+        rows = [
+            {'user_id': self.user_id, 'product_id': product_id, 'created_at': now, 'updated_at': now,
+             'quantity': min(in_cart.get(product_id, 0) + lines[product_id], available)}
+            for product_id, available in stock.items() if available > 0
+        ]
+        if not rows:
+            return
+        statement = upsert_insert()(CartItem.__table__)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'product_id'],
+            set_={'quantity': statement.excluded.quantity, 'updated_at': statement.excluded.updated_at}
+        ), rows)
+        # Hold what can still be held; the rest is checked again at checkout
+        reservations.hold(self.user_id, {row['product_id']: row['quantity'] for row in rows}, strict=False)
+        self._changed()
+
+
+class GuestCartStore:
+    """An anonymous visitor's cart in the local guest store, as ``{product_id: quantity}``."""
+
+    is_guest = True
+
+    def __init__(self, guest_id=None):
+        if guest_id and not GUEST_ID_PATTERN.match(guest_id):
+            guest_id = None
+        self.guest_id = guest_id
+
+    @property
+    def _key(self):
+        return f'guest_cart:{self.guest_id}'
+
+    @staticmethod
+    def _decode(stored):
+        return {int(product_id): quantity for product_id, quantity in (stored or {}).items()}
+
+    def lines(self):
+        if not self.guest_id:
+            return {}
+        return self._decode(_guest_backend.get(self._key))
+
+    def _update(self, change):
+        """Apply ``change(lines) -> lines`` to the stored cart as one atomic read-modify-write.
+
+        Concurrent requests for the same cart (e.g. two quick adds) queue on
+        the store instead of overwriting each other's lines. ``change`` may
+        raise CartError to leave the cart as it was.
+        """
+        guest_id = self.guest_id or secrets.token_urlsafe(16)
+
+        def apply(stored):
+            lines = change(self._decode(stored))
+            return {str(k): v for k, v in lines.items()} or None
+
+        lines = self._decode(_guest_backend.update(f'guest_cart:{guest_id}', apply, _guest_ttl))
+        self.guest_id = guest_id
+        return lines
+
+    def delete(self):
+        if self.guest_id:
+            _guest_backend.delete(self._key)
+
+    def _products(self, product_ids):
+        return {
+            product.id: product
+            for product in Product.query.options(*product_load_options()).filter(Product.id.in_(product_ids))
+        }
+
+    @staticmethod
+    def _item(product, quantity, today=None):
+        return {
+            'id': product.id,
+            'product': product.to_dict(today),
+            'quantity': quantity,
+            'subtotal': product.discounted_price * quantity
+        }
+
+    def payload(self):
+        lines = self.lines()
+        products = self._products(lines) if lines else {}
+        today = utc_today()
+        items = [self._item(products[product_id], quantity, today)
+                 for product_id, quantity in lines.items() if product_id in products]
+        return {
+            'items': items,
+            'total': sum(item['subtotal'] for item in items),
+            'count': len(items)
+        }
+
+    def summary(self):
+        lines = self.lines()
+        prices = dict(db.session.query(Product.id, Product.discounted_price).filter(
+            Product.id.in_(lines)
+        )) if lines else {}
+        return {
+            'count': len(prices),
+            'total': sum(prices[product_id] * quantity for product_id, quantity in lines.items() if product_id in prices)
+        }
+
+    def add(self, product_id, quantity):
+        _check_quantity(quantity, 1)
+        product = db.session.get(Product, product_id)
+
+        def change(lines):
+            error = _availability_error(product, lines.get(product_id, 0) + quantity)
+            if error:
+                raise error
+            lines[product_id] = lines.get(product_id, 0) + quantity
+            return lines
+
+        lines = self._update(change)
+        return self._item(product, lines[product_id])
+
+    def update(self, item_id, quantity):
+        _check_quantity(quantity)
+        product = db.session.get(Product, item_id) if quantity > 0 else None
+
+        def change(lines):
+            if item_id not in lines:
+                raise CartError('Cart item not found', 404)
+            if quantity <= 0:
+                del lines[item_id]
+            else:
+                error = _availability_error(product, quantity)
+                if error:
+                    raise error
+                lines[item_id] = quantity
+            return lines
+
+        self._update(change)
+
+    def remove(self, item_id):
+        def change(lines):
+            if item_id not in lines:
+                raise CartError('Cart item not found', 404)
+            del lines[item_id]
+            return lines
+
+        self._update(change)
+
+    def clear(self):
+        self.delete()
+
+    def apply(self, operations):
+        def change(lines):
+            quantities, touched = resolve_operations(lines, operations)
+            _check_stock(quantities, touched)
+            return {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+
+        self._update(change)
+
+
+def merge_guest_cart(user_id, guest_id):
+    """Move a guest cart into a user's cart after they sign in."""
+    guest = GuestCartStore(guest_id)
+    lines = guest.lines()
+    if lines:
+        SQLCartStore(user_id).merge(lines)
+    guest.delete()
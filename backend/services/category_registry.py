@@ -0,0 +1,69 @@
+"""Process-wide registry of categories.
+
+Categories change a few times a month, so each worker keeps them in memory.
+Any flush that inserts, updates or deletes a Category bumps the
+``categories`` row in ``registry_versions`` in the same transaction; bulk
+UPDATEs that bypass the ORM must call ``mark_changed()``. Every worker compares that single row with its own
+copy at most once every ``CATEGORY_REGISTRY_CHECK_INTERVAL`` seconds and
+reloads when it has moved.
+"""
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Category, RegistryVersion
+from services.conditional import make_etag
+from services.registry import VersionedRegistry
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_NAME = 'categories'
+
+
+class CategoryRegistry(VersionedRegistry):
+    registry_name = REGISTRY_NAME
+
+    def __init__(self):
+        super().__init__()
+        self.etag = None
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('CATEGORY_REGISTRY_CHECK_INTERVAL', 5)
+        self.version = None
+        with app.app_context():
+            try:
+                self.refresh()
+            except Exception:
+                # Tables may not exist yet (e.g. init_db); load on first use instead
+                db.session.rollback()
+                logger.info('Category registry not loaded at startup')
+
+    def refresh(self):
+        """Reload every category from the database."""
+        with self._lock:
+            version = RegistryVersion.current(REGISTRY_NAME)
+            by_id = {category.id: category.to_dict() for category in Category.query.order_by(Category.id).all()}
+            self._by_id = by_id
+            self.version = version
+            self.etag = make_etag(version, sorted(by_id.items()))
+            self._checked_at = time.monotonic()
+
+    def all(self, active_only=True):
+        self._ensure_fresh()
+        return [c for c in self._by_id.values() if c['is_active'] or not active_only]
+
+    def get(self, category_id):
+        self._ensure_fresh()
+        return self._by_id.get(category_id)
+
+
+category_registry = CategoryRegistry()
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_on_category_write(session, flush_context, instances):
+    if any(isinstance(obj, Category) for obj in (*session.new, *session.dirty, *session.deleted)):
+        CategoryRegistry.mark_changed()
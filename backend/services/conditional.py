@@ -0,0 +1,48 @@
+"""Conditional GET support: ETag, Last-Modified and 304 Not Modified.
+
+Validators are built from version data (ids, ``updated_at`` and the like)
+before anything is serialized, so a matching request skips ``to_dict`` and
+JSON encoding altogether.
+"""
+import hashlib
+from datetime import datetime, time, timezone
+from flask import request, jsonify, make_response
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def start_of_today():
+    """Midnight UTC; anything showing days_to_expiry changes at this point."""
+    return datetime.combine(datetime.utcnow().date(), time.min)
+
+
+def latest(*timestamps):
+    present = [t for t in timestamps if t is not None]
+    return max(present) if present else None
+
+
+def _http_datetime(value):
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def is_not_modified(etag, last_modified=None):
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _http_datetime(last_modified) <= request.if_modified_since
+    return False
+
+
+def conditional_json(etag, last_modified, build, status=200):
+    """Answer 304 if the client's validators match, otherwise ``jsonify(build())``."""
+    if is_not_modified(etag, last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_response(jsonify(build()), status)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _http_datetime(last_modified)
+    return response
@@ -0,0 +1,141 @@
+"""Expiry buckets and the background sweeper that keeps them current.
+
+``products.expiry_bucket`` stores which of ``EXPIRY_BUCKETS`` a product's
+days-to-expiry falls in, so "expiring soon" reads are an index range on a
+small integer. Buckets are relative to today (UTC): the sweeper runs at
+startup and every ``EXPIRY_SWEEP_INTERVAL`` seconds, deactivates stock whose expiry date has
+passed in batches of ``EXPIRY_SWEEP_BATCH_SIZE``, and re-buckets the rows
+that moved once the date changes. Listing queries also filter on
+``expiry_date`` directly, so nothing expired is served between sweeps, and
+the bucket only narrows the range: rows written since the last sweep may
+sit one bucket behind or have no bucket yet.
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, update
+from models import db, Product
+from services.background import PeriodicTask, end_read
+from services.cache import catalog_cache
+from services.suggest import suggester
+
+logger = logging.getLogger(__name__)
+
+# (label, min days, max days) to expiry; None is open-ended. Index = bucket number.
+EXPIRY_BUCKETS = [
+    ('today', 0, 0),
+    ('1-3 days', 1, 3),
+    ('4-7 days', 4, 7),
+    ('8-14 days', 8, 14),
+    ('15-30 days', 15, 30),
+    ('30+ days', 31, None),
+]
+EXPIRED = -1
+
+
+def utc_today():
+    return datetime.utcnow().date()
+
+
+def bucket_for_days(days):
+    """Bucket number for a product ``days`` days from expiry."""
+    if days < 0:
+        return EXPIRED
+    for i, (_, _, max_days) in enumerate(EXPIRY_BUCKETS):
+        if max_days is not None and days <= max_days:
+            return i
+    return len(EXPIRY_BUCKETS) - 1
+
+
+def expiry_bucket(expiry_date, today=None):
+    if expiry_date is None:
+        return None
+    return bucket_for_days((expiry_date - (today or utc_today())).days)
+
+
+def expiring_within(days, today=None):
+    """Filter for active listings expiring in at most ``days`` days (and not yet expired)."""
+    today = today or utc_today()
+    return and_(
+        # One bucket of slack: buckets can be a day stale until the next sweep
+        or_(Product.expiry_bucket.is_(None), Product.expiry_bucket.between(0, bucket_for_days(days) + 1)),
+        Product.expiry_date >= today,
+        Product.expiry_date <= today + timedelta(days=days)
+    )
+
+
+class ExpirySweeper:
+    def __init__(self):
+        self.batch_size = 500
+        self.bucketed_on = None
+        self._task = None
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('EXPIRY_SWEEP_BATCH_SIZE', 500)
+        self.bucketed_on = None
+        if self._task is not None:
+            self._task.stop()
+        self._task = PeriodicTask('expiry-sweeper', app.config.get('EXPIRY_SWEEP_INTERVAL', 300), self.sweep)
+        if app.config.get('BACKGROUND_TASKS_ENABLED', True):
+            # Don't serve a day-old bucketing until the first interval passes
+            with app.app_context():
+                try:
+                    self.sweep()
+                except Exception:
+                    # Tables may not exist yet (e.g. before migrations); the background task retries
+                    db.session.rollback()
+                    logger.info('Expiry sweep not run at startup')
+        self._task.start(app)
+
+    def sweep(self):
+        """Deactivate expired stock, then re-bucket if the date moved. Needs an app context."""
+        today = utc_today()
+        deactivated = self.deactivate_expired(today)
+        if self.bucketed_on != today:
+            self.rebucket(today)
+            self.bucketed_on = today
+        if deactivated:
+            logger.info('Deactivated %d expired products', len(deactivated))
+        return deactivated
+
+    def deactivate_expired(self, today):
+        table = Product.__table__
+        deactivated = []
+        while True:
+            ids = [product_id for (product_id,) in db.session.query(Product.id).filter(
+                Product.is_active == True,
+                Product.expiry_date < today
+            ).order_by(Product.expiry_date, Product.id).limit(self.batch_size)]
+            end_read()
+            if not ids:
+                break
+            # One short transaction per batch keeps row locks brief on a large backlog
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(table).where(table.c.id.in_(ids), table.c.is_active == True)
+                    .values(is_active=False, expiry_bucket=EXPIRED, updated_at=datetime.utcnow())
+                )
+            deactivated.extend(ids)
+
+        if deactivated:
+            catalog_cache.invalidate()
+            for product_id in deactivated:
+                suggester.remove_product(product_id)
+        return deactivated
+
+    def rebucket(self, today):
+        """Move products whose bucket changed since the last run; untouched rows are not written."""
+        table = Product.__table__
+        with db.engine.begin() as connection:
+            for bucket, (_, min_days, max_days) in enumerate(EXPIRY_BUCKETS):
+                in_range = [table.c.expiry_date >= today + timedelta(days=min_days)]
+                if max_days is not None:
+                    in_range.append(table.c.expiry_date <= today + timedelta(days=max_days))
+                connection.execute(
+                    update(table).where(
+                        *in_range,
+                        or_(table.c.expiry_bucket.is_(None), table.c.expiry_bucket != bucket)
+                    ).values(expiry_bucket=bucket, updated_at=table.c.updated_at)
+                )
+
+
+expiry_sweeper = ExpirySweeper()
@@ -0,0 +1,65 @@
+"""Facet counts for product listings.
+
+All facets come from one grouped aggregate over the filtered listing query:
+rows are grouped by (category, price band, expiry bucket) and each facet is
+the marginal sum of those groups.
+"""
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import case, func
+from models import Product
+from services.category_registry import category_registry
+from services.expiry import EXPIRY_BUCKETS, EXPIRED, utc_today
+
+# (min, max) on discounted_price; max is exclusive, None is open-ended
+PRICE_BANDS = [(0, 50), (50, 100), (100, 250), (250, 500), (500, 1000), (1000, None)]
+
+
+def _price_band():
+    whens = [(Product.discounted_price < upper, i) for i, (_, upper) in enumerate(PRICE_BANDS) if upper is not None]
+    return case(*whens, else_=len(PRICE_BANDS) - 1)
+
+
+def _expiry_bucket(today):
+    whens = [(Product.expiry_date < today, EXPIRED)]
+    whens += [
+        (Product.expiry_date <= today + timedelta(days=max_days), i)
+        for i, (_, _, max_days) in enumerate(EXPIRY_BUCKETS) if max_days is not None
+    ]
+    return case(*whens, else_=len(EXPIRY_BUCKETS) - 1)
+
+
+def _category_name(category_id):
+    category = category_registry.get(category_id)
+    return category['name'] if category else None
+
+
+def compute_facets(query, today=None):
+    """Category counts, price histogram and expiry buckets for a filtered Product query."""
+    today = today or utc_today()
+    price_band = _price_band().label('price_band')
+    expiry_bucket = _expiry_bucket(today).label('expiry_bucket')
+    rows = query.order_by(None).with_entities(
+        Product.category_id, price_band, expiry_bucket, func.count(Product.id)
+    ).group_by(Product.category_id, price_band, expiry_bucket).all()
+
+    categories, prices, expiry = Counter(), Counter(), Counter()
+    for category_id, band, bucket, count in rows:
+        categories[category_id] += count
+        prices[band] += count
+        expiry[bucket] += count
+
+    return {
+        'categories': [
+            {'category_id': category_id, 'category_name': _category_name(category_id), 'count': count}
+            for category_id, count in categories.most_common()
+        ],
+        'price': [
+            {'min': lower, 'max': upper, 'count': prices[i]}
+            for i, (lower, upper) in enumerate(PRICE_BANDS)
+        ],
+        'expiry': [
+            {'label': label, 'min_days': min_days, 'max_days': max_days, 'count': expiry[i]}
+            for i, (label, min_days, max_days) in enumerate(EXPIRY_BUCKETS)
+        ] + ([{'label': 'expired', 'min_days': None, 'max_days': -1, 'count': expiry[EXPIRED]}] if expiry[EXPIRED] else [])
+    }
@@ -0,0 +1,30 @@
+"""Streaming NDJSON catalog feed.
+
+Rows are fetched ``FEED_BATCH_SIZE`` at a time with ``yield_per`` (a
+server-side cursor on Postgres) and written out one batch per chunk, so
+memory stays flat however large the catalog is. Compression, when the
+client accepts gzip, happens chunk by chunk as the rows are produced.
+"""
+import json
+import zlib
+from models import db
+
+
+def ndjson_chunks(statement, serialize, batch_size=500):
+    """Yield newline-delimited JSON, one chunk per ``batch_size`` entities selected by ``statement``."""
+    batch = []
+    for row in db.session.execute(statement.execution_options(yield_per=batch_size)).scalars():
+        batch.append(json.dumps(serialize(row), separators=(',', ':')))
+        if len(batch) >= batch_size:
+            yield '\n'.join(batch) + '\n'
+            batch = []
+    if batch:
+        yield '\n'.join(batch) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks, flushing after each so clients see rows as they come."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
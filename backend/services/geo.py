@@ -0,0 +1,160 @@
+"""Pincode proximity: which vendors are within ``radius_km`` of a pincode.
+
+Pincodes are resolved to coordinates from a local CSV (``PINCODE_DATA_PATH``,
+columns ``pincode,latitude,longitude,place``). Exact six-digit rows win;
+otherwise the three-digit sorting-district prefix is used as an approximate
+centroid. The bundled ``data/pincodes.csv`` covers major cities only; point
+``PINCODE_DATA_PATH`` at a full directory for complete coverage.
+
+Vendor locations live in an in-memory grid of ``GEO_GRID_CELL_KM`` cells, so
+a radius query checks only the cells around the point, and results are
+cached per (pincode, radius). Listing queries then filter on
+``vendor_id IN (...)``. The grid is reloaded when the ``vendor_locations``
+row in ``registry_versions`` moves, checked at most once every
+``VENDOR_LOCATOR_CHECK_INTERVAL`` seconds, like the category registry.
+"""
+import csv
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from models import db, VendorProfile, RegistryVersion
+from services.registry import VersionedRegistry
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_NAME = 'vendor_locations'
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+NEAR_CACHE_SIZE = 1024
+
+
+class UnknownPincode(ValueError):
+    """Raised when a pincode is not in the pincode directory."""
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def normalize_pincode(pincode):
+    return re.sub(r'\D', '', str(pincode or ''))
+
+
+class PincodeDirectory:
+    def __init__(self):
+        self._coords = {}
+
+    def load(self, path):
+        coords = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                coords[normalize_pincode(row['pincode'])] = (float(row['latitude']), float(row['longitude']))
+        self._coords = coords
+
+    def locate(self, pincode):
+        """``(lat, lon)`` for a pincode, or None if neither it nor its district is known."""
+        pincode = normalize_pincode(pincode)
+        if not pincode:
+            return None
+        return self._coords.get(pincode) or self._coords.get(pincode[:3])
+
+
+class GridIndex:
+    """Points bucketed into square lat/lon cells of roughly ``cell_km``."""
+
+    def __init__(self, cell_km=10):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self._cells = {}
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, key, lat, lon):
+        self._cells.setdefault(self._cell(lat, lon), []).append((key, lat, lon))
+
+    def within(self, lat, lon, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_y, min_x = self._cell(lat - dlat, lon - dlon)
+        max_y, max_x = self._cell(lat + dlat, lon + dlon)
+        found = set()
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                for key, point_lat, point_lon in self._cells.get((y, x), ()):
+                    if haversine_km(lat, lon, point_lat, point_lon) <= radius_km:
+                        found.add(key)
+        return found
+
+
+class VendorLocator(VersionedRegistry):
+    registry_name = REGISTRY_NAME
+
+    def __init__(self):
+        super().__init__()
+        self.cell_km = 10
+        self.pincodes = PincodeDirectory()
+        self._grid = GridIndex()
+        self._near = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('VENDOR_LOCATOR_CHECK_INTERVAL', 5)
+        self.cell_km = app.config.get('GEO_GRID_CELL_KM', 10)
+        self.version = None
+        self.pincodes.load(app.config['PINCODE_DATA_PATH'])
+        with app.app_context():
+            try:
+                self.refresh()
+            except Exception:
+                # Tables may not exist yet (e.g. init_db); load on first use instead
+                db.session.rollback()
+                logger.info('Vendor locations not loaded at startup')
+
+    def refresh(self):
+        """Rebuild the grid from every vendor's pincode."""
+        with self._lock:
+            version = RegistryVersion.current(REGISTRY_NAME)
+            grid = GridIndex(self.cell_km)
+            unknown = 0
+            for vendor_id, pincode in db.session.query(VendorProfile.id, VendorProfile.pincode).filter(
+                VendorProfile.pincode.isnot(None)
+            ):
+                point = self.pincodes.locate(pincode)
+                if point is None:
+                    unknown += 1
+                    continue
+                grid.add(vendor_id, *point)
+            if unknown:
+                logger.info('%d vendor pincodes not found in the pincode directory', unknown)
+            self._grid = grid
+            self._near = OrderedDict()
+            self.version = version
+            self._checked_at = time.monotonic()
+
+    def vendors_near(self, pincode, radius_km):
+        """Sorted ids of vendors within ``radius_km`` of ``pincode``. Raises UnknownPincode."""
+        self._ensure_fresh()
+        key = (normalize_pincode(pincode), radius_km)
+        with self._lock:
+            vendor_ids = self._near.get(key)
+            if vendor_ids is not None:
+                self._near.move_to_end(key)
+                return vendor_ids
+        point = self.pincodes.locate(pincode)
+        if point is None:
+            raise UnknownPincode(f'Unknown pincode: {pincode}')
+        with self._lock:
+            vendor_ids = sorted(self._grid.within(point[0], point[1], radius_km))
+            self._near[key] = vendor_ids
+            if len(self._near) > NEAR_CACHE_SIZE:
+                self._near.popitem(last=False)
+        return vendor_ids
+
+
+vendor_locator = VendorLocator()
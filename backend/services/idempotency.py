@@ -0,0 +1,154 @@
+"""Idempotency-Key support for unsafe POSTs.
+
+A client that may retry (e.g. a mobile app on a flaky network) sends the
+same ``Idempotency-Key`` header with every attempt. The first attempt
+claims the key in ``idempotency_keys`` before running the view and stores
+the response afterwards; later attempts are answered from that row by its
+unique index, without running the view or touching products or carts.
+Replays carry ``Idempotent-Replayed: true``.
+
+Keys are scoped to the caller (user, guest cart or anonymous) and the
+endpoint. Reusing a key with a different request body answers 422; a retry
+that arrives while the first attempt is still running answers 409. 5xx
+responses are not stored, so the request can be retried for real. Stored
+responses expire after ``IDEMPOTENCY_KEY_TTL`` seconds and are purged in the
+background; a claim whose request never finished is released after
+``IDEMPOTENCY_LOCK_TIMEOUT`` seconds.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, update
+from models import db, IdempotencyKey, upsert_insert
+from services.background import PeriodicTask
+from services.cart_store import GUEST_CART_HEADER
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Per-request headers that must not be replayed
+SKIPPED_HEADERS = {'content-length', 'date', 'set-cookie'}
+
+
+class IdempotencyStore:
+    def __init__(self):
+        self.ttl = 24 * 3600
+        self.lock_timeout = 60
+        self._task = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDEMPOTENCY_KEY_TTL', 24 * 3600)
+        self.lock_timeout = app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', 60)
+        if self._task is not None:
+            self._task.stop()
+        self._task = PeriodicTask('idempotency-purge', app.config.get('IDEMPOTENCY_PURGE_INTERVAL', 3600), self.purge)
+        self._task.start(app)
+
+    def claim(self, owner, scope, key, fingerprint):
+        """Insert an in-progress row for the key. Returns its id, or None if the key is taken."""
+        now = datetime.utcnow()
+        statement = upsert_insert()(IdempotencyKey.__table__).values(
+            owner=owner, scope=scope, key=key, fingerprint=fingerprint, status='in_progress',
+            created_at=now, expires_at=now + timedelta(seconds=self.lock_timeout)
+        )
+        key_id = db.session.execute(
+            statement.on_conflict_do_nothing(index_elements=['owner', 'scope', 'key'])
+            .returning(IdempotencyKey.__table__.c.id)
+        ).scalar()
+        if key_id is None:
+            # Taken, but possibly expired: take it over if nobody else has
+            key_id = db.session.execute(
+                update(IdempotencyKey).where(
+                    IdempotencyKey.owner == owner, IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key, IdempotencyKey.expires_at <= now
+                ).values(
+                    fingerprint=fingerprint, status='in_progress', response_status=None, response_body=None,
+                    response_headers=None, created_at=now, expires_at=now + timedelta(seconds=self.lock_timeout)
+                ).returning(IdempotencyKey.id).execution_options(synchronize_session=False)
+            ).scalar()
+        db.session.commit()
+        return key_id
+
+    def lookup(self, owner, scope, key):
+        return IdempotencyKey.query.filter_by(owner=owner, scope=scope, key=key).first()
+
+    def complete(self, key_id, response):
+        db.session.rollback()  # whatever the view left behind
+        if response.status_code >= 500:
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == key_id))
+        else:
+            headers = [[name, value] for name, value in response.headers.items()
+                       if name.lower() not in SKIPPED_HEADERS]
+            db.session.execute(update(IdempotencyKey).where(IdempotencyKey.id == key_id).values(
+                status='complete', response_status=response.status_code,
+                response_body=response.get_data(as_text=True), response_headers=json.dumps(headers),
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl)
+            ))
+        db.session.commit()
+
+    def purge(self):
+        """Delete expired keys. Needs an app context."""
+        with db.engine.begin() as connection:
+            result = connection.execute(delete(IdempotencyKey.__table__).where(
+                IdempotencyKey.__table__.c.expires_at <= datetime.utcnow()
+            ))
+        if result.rowcount:
+            logger.info('Purged %d expired idempotency keys', result.rowcount)
+
+
+idempotency_store = IdempotencyStore()
+
+
+def _owner():
+    user_id = get_jwt_identity()
+    if user_id is not None:
+        return f'user:{user_id}'
+    guest_id = request.headers.get(GUEST_CART_HEADER)
+    return f'guest:{guest_id}' if guest_id else 'anonymous'
+
+
+def _replay(row):
+    response = Response(row.response_body, status=row.response_status)
+    for name, value in json.loads(row.response_headers or '[]'):
+        response.headers[name] = value
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Honour an Idempotency-Key header on this view. Goes below ``jwt_required``."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        owner, scope = _owner(), f'{request.method} {request.path}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        key_id = idempotency_store.claim(owner, scope, key, fingerprint)
+        if key_id is None:
+            row = idempotency_store.lookup(owner, scope, key)
+            if row is None:
+                # Purged between the claim and the lookup
+                return jsonify({'error': 'Please retry the request'}), 409
+            if row.fingerprint != fingerprint:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'}), 422
+            if row.status != 'complete':
+                return jsonify({'error': 'A request with this idempotency key is still in progress'}), 409
+            return _replay(row)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.complete(key_id, Response(status=500))
+            raise
+        idempotency_store.complete(key_id, response)
+        return response
+    return wrapper
@@ -0,0 +1,113 @@
+"""Stock changes made by checkout and cancellation.
+
+Stock is never read, checked in Python and written back: two checkouts could
+both pass the check and oversell. Each line instead runs one guarded
+``UPDATE products SET stock_quantity = stock_quantity - :q WHERE id = :id
+AND stock_quantity - reserved_quantity >= :q``. The database re-evaluates
+the guard against the committed row (Postgres re-checks it after waiting on
+the row lock; SQLite serializes writers), so a row count of 0 means the
+stock is no longer there and the caller rolls the whole order back. Lines
+are applied in product id order so concurrent multi-item checkouts lock rows
+in the same order and cannot deadlock.
+
+``reserved_quantity`` is stock held by other carts (see
+services/reservations.py) and is always 0 with reservations off. Units the
+buyer holds themselves are passed as ``held``: they come out of
+``reserved_quantity`` and are not checked again.
+
+Cancellation is set-based: orders are flipped to ``cancelled`` with one
+guarded UPDATE (so an order cancelled twice at once restores stock once),
+and stock, ``sold_count`` and ``trending_score`` for every product in those
+orders are restored with one batched UPDATE of per-product totals.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam, func, update
+from models import db, Order, OrderItem, Product
+from services import trending
+
+
+class OutOfStock(Exception):
+    """A guarded stock change matched no row; ``product_id`` ran short."""
+
+    def __init__(self, product_id):
+        super().__init__(f'Product {product_id} is out of stock')
+        self.product_id = product_id
+
+
+def decrement_stock(quantities, at=None, held=None):
+    """Take ``{product_id: quantity}`` out of stock and count the sale.
+
+    ``held`` is ``{product_id: quantity}`` already reserved by the buyer.
+    Raises OutOfStock on the first product that cannot cover its quantity;
+    the caller must roll back, undoing any lines already applied.
+    """
+    held = held or {}
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        from_hold = min(held.get(product_id, 0), quantity)
+        values = {
+            'stock_quantity': Product.stock_quantity - quantity,
+            'sold_count': func.coalesce(Product.sold_count, 0) + quantity,
+            'trending_score': func.coalesce(Product.trending_score, 0) + trending.sale_increment(quantity, at)
+        }
+        if held.get(product_id):
+            # Release the whole hold, even any part beyond what is being bought
+            values['reserved_quantity'] = Product.reserved_quantity - held[product_id]
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == product_id,
+                   Product.is_active == True,
+                   Product.stock_quantity - Product.reserved_quantity >= quantity - from_hold)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise OutOfStock(product_id)
+
+
+# Orders in these states can no longer be cancelled
+FINAL_ORDER_STATUSES = ('delivered', 'cancelled')
+
+
+def restore_stock(order_ids):
+    """Put the items of ``order_ids`` back in stock and undo their sales. Returns the product ids touched."""
+    if not order_ids:
+        return []
+    quantities, scores = defaultdict(int), defaultdict(float)
+    for product_id, quantity, ordered_at in db.session.query(
+        OrderItem.product_id, OrderItem.quantity, Order.created_at
+    ).join(Order, Order.id == OrderItem.order_id).filter(OrderItem.order_id.in_(order_ids)):
+        quantities[product_id] += quantity
+        scores[product_id] += trending.sale_increment(quantity, ordered_at)
+    if not quantities:
+        return []
+
+    table = Product.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('product')).values(
+            stock_quantity=table.c.stock_quantity + bindparam('quantity'),
+            sold_count=func.coalesce(table.c.sold_count, 0) - bindparam('quantity'),
+            trending_score=func.coalesce(table.c.trending_score, 0) - bindparam('score')
+        ),
+        [{'product': product_id, 'quantity': quantity, 'score': scores[product_id]}
+         for product_id, quantity in sorted(quantities.items())]
+    )
+    return sorted(quantities)
+
+
+def cancel_orders(order_ids):
+    """Cancel the orders among ``order_ids`` that are still open and restore their stock.
+
+    Runs in the caller's transaction and returns the ids actually cancelled.
+    """
+    if not order_ids:
+        return []
+    cancelled = [order_id for (order_id,) in db.session.execute(
+        update(Order).where(Order.id.in_(order_ids), Order.status.notin_(FINAL_ORDER_STATUSES))
+        .values(status='cancelled', updated_at=datetime.utcnow())
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    )]
+    restore_stock(cancelled)
+    return sorted(cancelled)
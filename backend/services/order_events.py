@@ -0,0 +1,22 @@
+"""Handlers for order jobs queued through the outbox (see services/tasks.py).
+
+Anything that should follow checkout without adding to its latency
+(confirmation email, vendor notifications, invoices, analytics) belongs
+here rather than in ``create_order``. Jobs can run more than once.
+"""
+import logging
+from models import db, Order, OrderItem, Product
+from services.tasks import task_queue
+
+logger = logging.getLogger(__name__)
+
+
+@task_queue.handler('order_placed')
+def order_placed(payload):
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        return
+    vendor_ids = sorted(vendor_id for (vendor_id,) in db.session.query(Product.vendor_id).join(
+        OrderItem, OrderItem.product_id == Product.id
+    ).filter(OrderItem.order_id == order.id).distinct())
+    logger.info('Order %s placed (%s); vendors to notify: %s', order.order_number, order.status, vendor_ids)
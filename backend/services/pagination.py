@@ -0,0 +1,95 @@
+"""Keyset (cursor) pagination for listing endpoints.
+
+A cursor records the sort values of the last row on a page, so the next
+page is a range read from that position instead of ``OFFSET n`` plus a
+``COUNT(*)``. Every sort order ends with the primary key as a tiebreaker.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from flask import jsonify, request
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed or was issued for another sort order."""
+
+
+def _dump(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(sort_key, values):
+    payload = json.dumps({'s': sort_key, 'v': [_dump(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_key, order):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload['s'] != sort_key or len(payload['v']) != len(order):
+            raise InvalidCursor('Invalid cursor')
+        return [_load(column, value) for (column, _), value in zip(order, payload['v'])]
+    except (KeyError, TypeError, ValueError, binascii.Error) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def _after(order, values):
+    """Condition selecting rows that sort strictly after ``values``."""
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_page(query, order, sort_key, cursor, per_page):
+    """Fetch one page of ``query`` sorted by ``order``.
+
+    ``order`` is a list of ``(column, descending)`` pairs ending with a unique
+    column. Returns ``(items, next_cursor)``; ``next_cursor`` is None on the
+    last page.
+    """
+    if cursor:
+        query = query.filter(_after(order, decode_cursor(cursor, sort_key, order)))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
+    if per_page < 1:
+        raise ValueError('per_page must be at least 1')
+    items = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(sort_key, [getattr(items[-1], column.key) for column, _ in order])
+    return items, next_cursor
+
+
+def keyset_response(query, order, sort_key, per_page, respond):
+    """Answer a listing request in cursor mode: no OFFSET and no COUNT(*).
+
+    Pages ``query`` from the request's ``cursor`` argument and returns
+    ``respond(items, next_cursor)``, or a 400 for a bad cursor or ``per_page``.
+    """
+    if per_page < 1:
+        return jsonify({'error': 'per_page must be a positive integer'}), 400
+    try:
+        items, next_cursor = keyset_page(query, order, sort_key, request.args.get('cursor'), per_page)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return respond(items, next_cursor)
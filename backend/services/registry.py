@@ -0,0 +1,35 @@
+"""In-memory copies of rarely changing tables, kept in step across workers.
+
+Each registry names a row in ``registry_versions``. Writers bump it with
+``mark_changed()`` before committing; readers call ``_ensure_fresh()``, which
+compares the row with the loaded version at most once every
+``check_interval`` seconds and calls ``refresh()`` when it has moved.
+"""
+import time
+from models import RegistryVersion
+
+
+class VersionedRegistry:
+    registry_name = None
+
+    def __init__(self):
+        self.check_interval = 5
+        self.version = None
+        self._checked_at = 0.0
+
+    def refresh(self):
+        """Reload from the database and set ``version`` and ``_checked_at``."""
+        raise NotImplementedError
+
+    def _ensure_fresh(self):
+        if self.version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        if self.version is None or RegistryVersion.current(self.registry_name) != self.version:
+            self.refresh()
+        else:
+            self._checked_at = time.monotonic()
+
+    @classmethod
+    def mark_changed(cls):
+        """Record a change; call before committing it."""
+        RegistryVersion.bump(cls.registry_name)
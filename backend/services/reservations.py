@@ -0,0 +1,173 @@
+"""Time-boxed stock holds for signed-in carts (``STOCK_RESERVATIONS_ENABLED``).
+
+With reservations on, every change to a signed-in cart line also sets the
+user's hold on that product to the line's quantity, for
+``STOCK_RESERVATION_TTL`` seconds from the change. Holds live in
+``stock_reservations`` and are summed into ``products.reserved_quantity`` as
+they change, so available stock (``stock_quantity - reserved_quantity``) is
+a column read, never an aggregate over reservations. Taking more stock is a
+guarded increment that fails when the rest is already held.
+
+A background reaper releases expired holds every
+``STOCK_RESERVATION_REAP_INTERVAL`` seconds, ``STOCK_RESERVATION_REAP_BATCH_SIZE``
+at a time, with one DELETE ... RETURNING and one batched UPDATE per batch.
+Checkout deletes the user's holds the same way and passes them to
+``decrement_stock``, which only re-checks stock for units that were not held.
+A hold that expired before checkout just means that line competes for
+unheld stock again. Guest carts do not reserve.
+
+The reaper only runs with reservations on. With them off, each worker
+instead releases every hold left over from a period with them on once at
+startup, so no stock stays held.
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, delete, update
+from models import db, Product, StockReservation, upsert_insert
+from services.background import PeriodicTask, end_read
+from services.inventory import OutOfStock
+
+logger = logging.getLogger(__name__)
+
+
+class ReservationManager:
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 900
+        self.batch_size = 500
+        self._task = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('STOCK_RESERVATIONS_ENABLED', False)
+        self.ttl = app.config.get('STOCK_RESERVATION_TTL', 900)
+        self.batch_size = app.config.get('STOCK_RESERVATION_REAP_BATCH_SIZE', 500)
+        if self._task is not None:
+            self._task.stop()
+            self._task = None
+        if self.enabled:
+            self._task = PeriodicTask('reservation-reaper', app.config.get('STOCK_RESERVATION_REAP_INTERVAL', 60),
+                                      self.release_expired)
+            self._task.start(app)
+        elif app.config.get('BACKGROUND_TASKS_ENABLED', True):
+            with app.app_context():
+                try:
+                    self.release_expired(now=datetime.max)
+                except Exception:
+                    # Tables may not exist yet (e.g. before migrations)
+                    db.session.rollback()
+                    logger.info('Leftover stock reservations not released at startup')
+
+    def hold(self, user_id, quantities, strict=True):
+        """Set the user's holds to ``{product_id: quantity}`` (0 releases) in the caller's transaction.
+
+        Raises OutOfStock if a product cannot cover a larger hold; with
+        ``strict=False`` that product keeps its current hold instead.
+        """
+        if not self.enabled or not quantities:
+            return
+        held = dict(db.session.query(StockReservation.product_id, StockReservation.quantity).filter(
+            StockReservation.user_id == user_id,
+            StockReservation.product_id.in_(quantities)
+        ).with_for_update())
+
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        keep, release = [], []
+        for product_id in sorted(quantities):
+            quantity, current = quantities[product_id], held.get(product_id, 0)
+            delta = quantity - current
+            if delta:
+                statement = update(Product).where(Product.id == product_id)
+                if delta > 0:
+                    statement = statement.where(Product.is_active == True,
+                                                Product.stock_quantity - Product.reserved_quantity >= delta)
+                result = db.session.execute(
+                    statement.values(reserved_quantity=Product.reserved_quantity + delta,
+                                     updated_at=Product.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    if strict:
+                        raise OutOfStock(product_id)
+                    quantity = current
+            if quantity > 0:
+                keep.append({'user_id': user_id, 'product_id': product_id,
+                             'quantity': quantity, 'expires_at': expires_at})
+            elif current:
+                release.append(product_id)
+
+        if keep:
+            statement = upsert_insert()(StockReservation.__table__)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['user_id', 'product_id'],
+                set_={'quantity': statement.excluded.quantity, 'expires_at': statement.excluded.expires_at}
+            ), keep)
+        if release:
+            db.session.execute(delete(StockReservation).where(
+                StockReservation.user_id == user_id,
+                StockReservation.product_id.in_(release)
+            ))
+
+    def held(self, user_id, product_ids):
+        """The user's current holds on ``product_ids`` as ``{product_id: quantity}``, in one query."""
+        if not self.enabled or not product_ids:
+            return {}
+        return dict(db.session.query(StockReservation.product_id, StockReservation.quantity).filter(
+            StockReservation.user_id == user_id,
+            StockReservation.product_id.in_(product_ids)
+        ))
+
+    def available_to(self, user_id, product):
+        """Units ``user_id`` can have in their cart: unheld stock plus their own hold."""
+        return product.available_quantity + self.held(user_id, [product.id]).get(product.id, 0)
+
+    def take(self, user_id, product_ids):
+        """Delete the user's holds on ``product_ids`` and return them as ``{product_id: quantity}``.
+
+        Expired holds the reaper has not released yet still count: they are
+        in ``reserved_quantity`` until someone deletes them.
+        """
+        if not product_ids:
+            return {}
+        rows = db.session.execute(delete(StockReservation).where(
+            StockReservation.user_id == user_id,
+            StockReservation.product_id.in_(product_ids)
+        ).returning(StockReservation.product_id, StockReservation.quantity)).all()
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def release_expired(self, now=None):
+        """Release every expired hold, one short transaction per batch. Needs an app context."""
+        now = now or datetime.utcnow()
+        holds, products = StockReservation.__table__, Product.__table__
+        released = 0
+        while True:
+            ids = [reservation_id for (reservation_id,) in db.session.query(StockReservation.id).filter(
+                StockReservation.expires_at <= now
+            ).order_by(StockReservation.expires_at).limit(self.batch_size)]
+            end_read()
+            if not ids:
+                break
+            with db.engine.begin() as connection:
+                # RETURNING reports only rows this statement deleted, so a hold
+                # taken by a checkout in the meantime is never released twice
+                rows = connection.execute(
+                    delete(holds).where(holds.c.id.in_(ids), holds.c.expires_at <= now)
+                    .returning(holds.c.product_id, holds.c.quantity)
+                ).all()
+                totals = {}
+                for product_id, quantity in rows:
+                    totals[product_id] = totals.get(product_id, 0) + quantity
+                if totals:
+                    connection.execute(
+                        update(products).where(products.c.id == bindparam('product'))
+                        .values(reserved_quantity=products.c.reserved_quantity - bindparam('released'),
+                                updated_at=products.c.updated_at),
+                        [{'product': product_id, 'released': quantity} for product_id, quantity in totals.items()]
+                    )
+            released += len(rows)
+
+        if released:
+            logger.info('Released %d expired stock reservations', released)
+        return released
+
+
+reservations = ReservationManager()
@@ -0,0 +1,110 @@
+"""Full-text product search.
+
+SQLite (development) keeps a ``products_fts`` FTS5 table using the porter
+stemmer, which the vendor routes update whenever a product is written.
+Postgres (production) uses a GIN expression index over ``to_tsvector`` that
+the database maintains on its own. Any other backend falls back to ILIKE.
+"""
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, or_, select, table, text
+from models import db, Product
+
+FTS_TABLE = 'products_fts'
+SEARCH_INDEX = 'ix_products_search'
+
+# Keep this expression identical to the one used by the GIN index,
+# otherwise Postgres will not pick the index for search queries.
+_DOCUMENT = ("to_tsvector('english', coalesce({p}name, '') || ' ' || "
+             "coalesce({p}brand, '') || ' ' || coalesce({p}description, ''))")
+
+CREATE_FTS_TABLE = (f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    "USING fts5(name, brand, description, tokenize='porter unicode61')")
+CREATE_SEARCH_INDEX = (f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON products "
+                       f"USING gin ({_DOCUMENT.format(p='')})")
+
+event.listen(Product.__table__, 'after_create', DDL(CREATE_FTS_TABLE).execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'after_create', DDL(CREATE_SEARCH_INDEX).execute_if(dialect='postgresql'))
+event.listen(Product.__table__, 'before_drop', DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect='sqlite'))
+
+_fts = table(FTS_TABLE, column('rowid'), column('rank'))
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _tokens(term):
+    return re.findall(r'[^\W_]+', term.lower())
+
+
+def _fts5_query(tokens):
+    # The last token is usually still being typed, so match it as a prefix
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _tsquery(tokens):
+    return ' & '.join(tokens[:-1] + [tokens[-1] + ':*'])
+
+
+def apply_search(query, term):
+    """Restrict a Product query to matches for ``term``.
+
+    Returns ``(query, rank)`` where ``rank`` orders results best match first,
+    or is None when the backend cannot rank.
+    """
+    tokens = _tokens(term)
+    dialect = _dialect()
+
+    if tokens and dialect == 'sqlite':
+        hits = select(
+            _fts.c.rowid.label('product_id'),
+            _fts.c.rank.label('rank')
+        ).where(literal_column(FTS_TABLE).op('MATCH')(_fts5_query(tokens))).subquery('search_hits')
+        query = query.join(hits, hits.c.product_id == Product.id)
+        return query, hits.c.rank.asc()
+
+    if tokens and dialect == 'postgresql':
+        document = literal_column(_DOCUMENT.format(p='products.'))
+        ts_query = func.to_tsquery('english', _tsquery(tokens))
+        query = query.filter(document.op('@@')(ts_query))
+        return query, func.ts_rank(document, ts_query).desc()
+
+    query = query.filter(or_(
+        Product.name.ilike(f'%{term}%'),
+        Product.description.ilike(f'%{term}%'),
+        Product.brand.ilike(f'%{term}%')
+    ))
+    return query, None
+
+
+def index_product(product):
+    """Add or refresh a product in the search index (call before commit)."""
+    if _dialect() != 'sqlite':
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': product.id})
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE} (rowid, name, brand, description) "
+             "VALUES (:id, :name, :brand, :description)"),
+        {'id': product.id, 'name': product.name, 'brand': product.brand, 'description': product.description}
+    )
+
+
+def remove_product(product_id):
+    """Drop a product from the search index (call before commit)."""
+    if _dialect() != 'sqlite':
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': product_id})
+
+
+def rebuild_index():
+    """Repopulate the SQLite index from the products table."""
+    if _dialect() != 'sqlite':
+        return
+    db.session.execute(text(CREATE_FTS_TABLE))
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    db.session.execute(text(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, brand, description) "
+        "SELECT id, name, brand, description FROM products"
+    ))
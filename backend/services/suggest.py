@@ -0,0 +1,262 @@
+"""In-memory prefix index for search-box autocomplete.
+
+Every word suffix of active product names, brands and category names is
+stored as a sorted list of ``(term, entry)`` keys, so a prefix lookup is a
+bisect plus a short scan. Short prefixes match thousands of keys, so their
+ranked results are cached; a write re-ranks the cached prefixes of the terms
+it touched, so that cost lands on the write rather than the next lookup.
+The index is built at startup, kept current by the vendor routes on this
+worker and rebuilt in the background every ``SUGGEST_REBUILD_INTERVAL``
+seconds to pick up other workers' writes and popularity changes. Writes made
+on this worker while a rebuild is reading are replayed onto the new index
+before it goes live. Lookups never touch the database.
+"""
+import heapq
+import logging
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from types import SimpleNamespace
+from sqlalchemy import func
+from models import db, Product
+from services.background import PeriodicTask
+from services.category_registry import category_registry
+from services.trending import VIEW_WEIGHT
+
+logger = logging.getLogger(__name__)
+
+MAX_SUGGESTIONS = 20
+SCAN_LIMIT = 256         # prefixes matching more keys than this get their results cached
+PREFIX_CACHE_SIZE = 4096
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'[^\W_]+', (text or '').lower()))
+
+
+def _terms(text):
+    """Every word suffix: 'amul butter' -> ['amul butter', 'butter']"""
+    words = normalize(text).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def _popularity(sold_count, views_count):
+    return (sold_count or 0) + VIEW_WEIGHT * (views_count or 0)
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._keys = []              # sorted (term, entry_key)
+        self._entries = {}           # entry_key -> suggestion dict
+        self._terms = {}             # entry_key -> indexed terms
+        self._scores = {}            # entry_key -> popularity
+        self._products = {}          # product_id -> (brand_key, category_key, score)
+        self._brand_products = {}    # brand_key -> number of products
+        self._prefix_cache = OrderedDict()
+        self._stale = set()          # cached prefixes invalidated by the current write
+        self._lock = threading.RLock()
+
+    # -- building -----------------------------------------------------------
+
+    @classmethod
+    def build(cls, products, categories):
+        """Build from ``(id, name, brand, category_id, sold_count, views_count)`` rows."""
+        index = cls()
+        for category in categories:
+            key = ('category', category['id'])
+            index._entries[key] = {'text': category['name'], 'type': 'category', 'id': category['id']}
+            index._terms[key] = _terms(category['name'])
+            index._scores[key] = 0.0
+        for row in products:
+            index._add_product(*row, sort=False)
+        index._keys = sorted(
+            (term, key) for key, terms in index._terms.items() if key in index._entries for term in terms
+        )
+        return index
+
+    # -- lookups ------------------------------------------------------------
+
+    def suggest(self, query, limit=8):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        with self._lock:
+            ranked = self._prefix_cache.get(prefix)
+            if ranked is None:
+                ranked = self._rank(prefix)
+            else:
+                self._prefix_cache.move_to_end(prefix)
+            return [self._entries[key] for key in ranked[:limit]]
+
+    def _rank(self, prefix):
+        keys = self._keys
+        start = i = bisect_left(keys, (prefix,))
+        matches = set()
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            matches.add(keys[i][1])
+            i += 1
+        ranked = heapq.nlargest(MAX_SUGGESTIONS, matches,
+                                key=lambda key: (self._scores[key], self._entries[key]['text']))
+        if i - start > SCAN_LIMIT:
+            self._prefix_cache[prefix] = ranked
+            if len(self._prefix_cache) > PREFIX_CACHE_SIZE:
+                self._prefix_cache.popitem(last=False)
+        return ranked
+
+    # -- incremental updates --------------------------------------------------
+
+    def upsert_product(self, product):
+        """Reflect a committed product write."""
+        with self._lock:
+            self._remove_product(product.id)
+            if product.is_active:
+                self._add_product(product.id, product.name, product.brand, product.category_id,
+                                  product.sold_count, product.views_count)
+            self._rerank_stale()
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove_product(product_id)
+            self._rerank_stale()
+
+    def _rerank_stale(self):
+        stale, self._stale = self._stale, set()
+        for prefix in stale:
+            self._prefix_cache.pop(prefix, None)
+            self._rank(prefix)
+
+    def _add_product(self, product_id, name, brand, category_id, sold_count, views_count, sort=True):
+        score = _popularity(sold_count, views_count)
+        product_key = ('product', product_id)
+        self._set_entry(product_key, {'text': name, 'type': 'product', 'id': product_id}, score, sort)
+
+        brand_key = None
+        if normalize(brand):
+            brand_key = ('brand', normalize(brand))
+            if brand_key not in self._entries:
+                self._set_entry(brand_key, {'text': brand.strip(), 'type': 'brand'}, 0.0, sort)
+            self._brand_products[brand_key] = self._brand_products.get(brand_key, 0) + 1
+            self._adjust_score(brand_key, score)
+
+        category_key = ('category', category_id)
+        if category_key in self._entries:
+            self._adjust_score(category_key, score)
+
+        self._products[product_id] = (brand_key, category_key, score)
+
+    def _remove_product(self, product_id):
+        indexed = self._products.pop(product_id, None)
+        if indexed is None:
+            return
+        brand_key, category_key, score = indexed
+        self._drop_entry(('product', product_id))
+        if brand_key is not None:
+            self._brand_products[brand_key] -= 1
+            if self._brand_products[brand_key] == 0:
+                del self._brand_products[brand_key]
+                self._drop_entry(brand_key)
+            else:
+                self._adjust_score(brand_key, -score)
+        if category_key in self._entries:
+            self._adjust_score(category_key, -score)
+
+    def _set_entry(self, key, entry, score, sort=True):
+        self._entries[key] = entry
+        self._scores[key] = score
+        terms = _terms(entry['text'])
+        self._terms[key] = terms
+        if sort:
+            for term in terms:
+                self._keys.insert(bisect_left(self._keys, (term, key)), (term, key))
+                self._evict_prefixes(term)
+
+    def _drop_entry(self, key):
+        self._entries.pop(key, None)
+        self._scores.pop(key, None)
+        for term in self._terms.pop(key, []):
+            i = bisect_left(self._keys, (term, key))
+            if i < len(self._keys) and self._keys[i] == (term, key):
+                del self._keys[i]
+            self._evict_prefixes(term)
+
+    def _adjust_score(self, key, delta):
+        self._scores[key] += delta
+        for term in self._terms.get(key, []):
+            self._evict_prefixes(term)
+
+    def _evict_prefixes(self, term):
+        if self._prefix_cache:
+            for end in range(1, len(term) + 1):
+                if term[:end] in self._prefix_cache:
+                    self._stale.add(term[:end])
+
+
+class Suggester:
+    """Holds the live index for this worker and rebuilds it in the background."""
+
+    def __init__(self):
+        self.index = SuggestIndex()
+        self._task = None
+        self._lock = threading.Lock()
+        self._pending = None         # writes seen while a rebuild runs, replayed before the swap
+
+    def init_app(self, app):
+        if self._task is not None:
+            self._task.stop()
+        self._task = PeriodicTask('suggest-rebuild', app.config.get('SUGGEST_REBUILD_INTERVAL', 300), self.rebuild)
+        with app.app_context():
+            try:
+                self.rebuild()
+            except Exception:
+                # Tables may not exist yet (e.g. init_db); the background task retries
+                db.session.rollback()
+                logger.info('Suggest index not built at startup')
+        self._task.start(app)
+
+    def rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            products = db.session.query(
+                Product.id, Product.name, Product.brand, Product.category_id,
+                func.coalesce(Product.sold_count, 0), func.coalesce(Product.views_count, 0)
+            ).filter(Product.is_active == True).all()
+            index = SuggestIndex.build(products, category_registry.all())
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            # The query may have missed writes committed after it started;
+            # replaying ones it did see is harmless
+            for product_id, product in self._pending:
+                if product is None:
+                    index.remove_product(product_id)
+                else:
+                    index.upsert_product(product)
+            self._pending = None
+            self.index = index
+
+    def suggest(self, query, limit=8):
+        return self.index.suggest(query, limit)
+
+    def upsert_product(self, product):
+        with self._lock:
+            if self._pending is not None:
+                # Copy now: the ORM object may be expired or changed by the time it is replayed
+                self._pending.append((product.id, SimpleNamespace(
+                    id=product.id, name=product.name, brand=product.brand, category_id=product.category_id,
+                    sold_count=product.sold_count, views_count=product.views_count, is_active=product.is_active
+                )))
+            self.index.upsert_product(product)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product_id, None))
+            self.index.remove_product(product_id)
+
+
+suggester = Suggester()
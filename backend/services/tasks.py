@@ -0,0 +1,206 @@
+"""Background jobs from a transactional outbox.
+
+Request handlers call ``enqueue(kind, payload)`` inside their own
+transaction, which only adds an ``outbox_jobs`` row: the job exists exactly
+when the change that caused it commits, and the request returns right after
+the commit. A dispatcher on a daemon thread polls every
+``TASK_QUEUE_POLL_INTERVAL`` seconds (or at once after ``wake()``), claims due
+jobs with a guarded UPDATE so several workers or processes never run the
+same job, and runs them on a pool of ``TASK_QUEUE_WORKERS`` threads.
+
+A job that raises is retried up to ``TASK_QUEUE_MAX_ATTEMPTS`` times with
+exponential backoff from ``TASK_QUEUE_RETRY_DELAY`` seconds, then left as
+``failed`` with its last error. A job still ``running`` after
+``TASK_QUEUE_STALE_AFTER`` seconds (its worker died) is claimed again, and
+counts as an attempt: once it has used all its attempts it is marked
+``failed`` instead, so a job that kills its worker cannot loop forever.
+Finished jobs are deleted. Handlers must tolerate running more than once.
+
+Register handlers with ``@task_queue.handler('kind')``.
+"""
+import json
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, update
+from models import db, OutboxJob
+from services.background import PeriodicTask, end_read
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(kind, payload):
+    """Add a job to the caller's transaction; it runs only if that transaction commits."""
+    job = OutboxJob(kind=kind, payload=json.dumps(payload), run_after=datetime.utcnow())
+    db.session.add(job)
+    return job
+
+
+class TaskQueue:
+    def __init__(self):
+        self.workers = 2
+        self.max_attempts = 5
+        self.retry_delay = 10
+        self.stale_after = 300
+        self._handlers = {}
+        self._app = None
+        self._task = None
+        self._executor = None
+        self._running = 0
+        self._lock = threading.Lock()
+        self._stats = {'completed': 0, 'retried': 0, 'failed': 0, 'latency_total': 0.0, 'latency_max': 0.0,
+                       'run_time_total': 0.0}
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = app.config.get('TASK_QUEUE_WORKERS', 2)
+        self.max_attempts = app.config.get('TASK_QUEUE_MAX_ATTEMPTS', 5)
+        self.retry_delay = app.config.get('TASK_QUEUE_RETRY_DELAY', 10)
+        self.stale_after = app.config.get('TASK_QUEUE_STALE_AFTER', 300)
+        if self._task is not None:
+            self._task.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='task-worker')
+        self._task = PeriodicTask('task-dispatcher', app.config.get('TASK_QUEUE_POLL_INTERVAL', 2), self.dispatch)
+        self._task.start(app)
+
+    def handler(self, kind):
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def wake(self):
+        """Dispatch now instead of at the next poll, e.g. right after enqueuing."""
+        if self._task is not None:
+            self._task.wake()
+
+    def dispatch(self):
+        """Claim as many due jobs as there are idle workers and hand them over. Needs an app context."""
+        with self._lock:
+            idle = self.workers - self._running
+        if idle <= 0:
+            return 0
+        now = datetime.utcnow()
+        stale = (OutboxJob.status == 'running') & (OutboxJob.started_at <= now - timedelta(seconds=self.stale_after))
+        due = or_(
+            (OutboxJob.status == 'pending') & (OutboxJob.run_after <= now),
+            stale & (OutboxJob.attempts < self.max_attempts)
+        )
+        ids = [job_id for (job_id,) in db.session.query(OutboxJob.id).filter(due).order_by(
+            OutboxJob.run_after, OutboxJob.id
+        ).limit(idle)]
+        abandoned = db.session.query(OutboxJob.id).filter(stale, OutboxJob.attempts >= self.max_attempts).first()
+        end_read()
+        if abandoned is not None:
+            self._fail_abandoned(stale)
+        if not ids:
+            return 0
+
+        claimed = []
+        for job_id in ids:
+            # Guarded claim: if another dispatcher got there first, no row matches
+            result = db.session.execute(
+                update(OutboxJob).where(OutboxJob.id == job_id, due)
+                .values(status='running', started_at=now, attempts=OutboxJob.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(job_id)
+        db.session.commit()
+
+        for job_id in claimed:
+            with self._lock:
+                self._running += 1
+            self._executor.submit(self._run, job_id)
+        return len(claimed)
+
+    def _fail_abandoned(self, stale):
+        """Give up on stale jobs that have no attempts left."""
+        result = db.session.execute(
+            update(OutboxJob).where(stale, OutboxJob.attempts >= self.max_attempts)
+            .values(status='failed', last_error=f'Still running after {self.stale_after}s on its last attempt; '
+                                                 'the worker probably died')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount:
+            with self._lock:
+                self._stats['failed'] += result.rowcount
+            logger.warning('Gave up on %d job(s) whose worker died on the last attempt', result.rowcount)
+
+    def _run(self, job_id):
+        try:
+            with self._app.app_context():
+                self.process(job_id)
+        except Exception:
+            logger.exception('Task worker failed on job %s', job_id)
+        finally:
+            with self._lock:
+                self._running -= 1
+            # Freed a worker; pick up anything that queued behind it
+            self.wake()
+
+    def process(self, job_id):
+        """Run one claimed job and record the outcome. Needs an app context."""
+        job = db.session.get(OutboxJob, job_id)
+        if job is None or job.status != 'running':
+            return
+        kind, payload, created_at, attempts = job.kind, json.loads(job.payload), job.created_at, job.attempts
+        db.session.rollback()
+
+        started = time.monotonic()
+        try:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                raise LookupError(f'No handler registered for {kind} jobs')
+            handler(payload)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc(limit=5)
+            retry = attempts < self.max_attempts
+            values = {'last_error': error, 'status': 'pending' if retry else 'failed'}
+            if retry:
+                values['run_after'] = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (attempts - 1))
+            db.session.execute(update(OutboxJob).where(OutboxJob.id == job_id).values(**values))
+            db.session.commit()
+            with self._lock:
+                self._stats['retried' if retry else 'failed'] += 1
+            logger.warning('Job %s (%s) failed on attempt %d%s', job_id, kind, attempts,
+                           '' if retry else '; giving up')
+            return
+
+        db.session.query(OutboxJob).filter_by(id=job_id).delete()
+        db.session.commit()
+        latency = (datetime.utcnow() - created_at).total_seconds()
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['latency_total'] += latency
+            self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+            self._stats['run_time_total'] += time.monotonic() - started
+
+    def stats(self):
+        """Queue depth by status (all workers) and job latency in this process. Needs an app context."""
+        depth = dict(db.session.query(OutboxJob.status, func.count(OutboxJob.id)).group_by(OutboxJob.status))
+        with self._lock:
+            stats = dict(self._stats)
+            running_here = self._running
+        completed = stats['completed']
+        return {
+            'depth': {status: depth.get(status, 0) for status in ('pending', 'running', 'failed')},
+            'running_here': running_here,
+            'completed': completed,
+            'retried': stats['retried'],
+            'failed': stats['failed'],
+            'latency_avg': stats['latency_total'] / completed if completed else None,
+            'latency_max': stats['latency_max'] if completed else None,
+            'run_time_avg': stats['run_time_total'] / completed if completed else None
+        }
+
+
+task_queue = TaskQueue()
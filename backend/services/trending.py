@@ -0,0 +1,38 @@
+"""Incrementally maintained, time-decayed trending score.
+
+Instead of decaying every stored score as time passes, each event adds
+``weight * 2 ** ((now - EPOCH) / HALF_LIFE)`` to ``products.trending_score``.
+Newer events count exponentially more, which ranks products exactly as
+exponentially decayed scores would, so /trending is a plain index range
+read on ``(is_active, trending_score)``. Divide by ``boost()`` to get the
+decayed value as of now.
+
+The boost doubles every half-life and overflows a float after roughly 1000
+half-lives (about eight years). Well before that, ship a migration that
+moves EPOCH forward and divides every stored score by the same factor.
+"""
+from datetime import datetime, timedelta
+
+EPOCH = datetime(2026, 1, 1)
+HALF_LIFE = timedelta(days=3)
+
+SALE_WEIGHT = 1.0   # per unit sold
+VIEW_WEIGHT = 0.05  # per product detail view
+
+
+def boost(at=None):
+    at = at or datetime.utcnow()
+    return 2 ** ((at - EPOCH).total_seconds() / HALF_LIFE.total_seconds())
+
+
+def sale_increment(quantity, at=None):
+    """Score added by selling ``quantity`` units at ``at`` (negate to undo a sale)."""
+    return quantity * SALE_WEIGHT * boost(at)
+
+
+def view_increment(views, at=None):
+    return views * VIEW_WEIGHT * boost(at)
+
+
+def decayed(score, at=None):
+    return (score or 0) / boost(at)
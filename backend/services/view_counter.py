@@ -0,0 +1,84 @@
+"""Write-behind buffering for product view counts.
+
+Product detail reads record a view in memory; a background task adds the
+buffered increments to ``products.views_count`` in one batched UPDATE every
+``VIEW_COUNT_FLUSH_INTERVAL`` seconds, sooner once
+``VIEW_COUNT_FLUSH_THRESHOLD`` views are pending, and once more at shutdown.
+With ``BACKGROUND_TASKS_ENABLED`` off, views are only flushed at shutdown.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import bindparam, update
+from models import db, Product
+from services.background import PeriodicTask
+from services import trending
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    def __init__(self):
+        self.threshold = 500
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._task = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self.threshold = app.config.get('VIEW_COUNT_FLUSH_THRESHOLD', 500)
+        if self._task is not None:
+            self._task.stop()
+        self._task = PeriodicTask('view-counter', app.config.get('VIEW_COUNT_FLUSH_INTERVAL', 10), self.flush)
+        self._task.start(app)
+        if not self._atexit_registered:
+            # Flushes through whichever task is current at exit
+            atexit.register(self._flush_at_exit)
+            self._atexit_registered = True
+
+    def _flush_at_exit(self):
+        if self._task is not None:
+            self._task.run_once()
+
+    def record(self, product_id):
+        with self._lock:
+            self._pending[product_id] += 1
+            self._pending_total += 1
+            full = self._pending_total >= self.threshold
+        if full and self._task is not None:
+            self._task.wake()
+
+    def flush(self):
+        """Apply buffered views to the database. Needs an app context."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+        if not pending:
+            return
+
+        statement = update(Product.__table__).where(
+            Product.__table__.c.id == bindparam('product_id')
+        ).values(
+            views_count=Product.__table__.c.views_count + bindparam('views'),
+            trending_score=Product.__table__.c.trending_score + bindparam('score'),
+            # Views are analytics, not content: leave updated_at alone
+            updated_at=Product.__table__.c.updated_at
+        )
+        rows = [
+            {'product_id': product_id, 'views': views, 'score': trending.view_increment(views)}
+            for product_id, views in pending.items()
+        ]
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement, rows)
+        except Exception:
+            # Put the counts back so the next flush retries them
+            with self._lock:
+                self._pending.update(pending)
+                self._pending_total += sum(pending.values())
+            raise
+
+
+view_counter = ViewCounter()